@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
-from quotations import QuotationValidator
+from quotations import LanguagePairValidator, QuotationValidator
 
 __title__ = 'quotations'
 __version__ = '0.1.0'
 __author__ = 'Kelvin Tay'
 
-__all__ = ['QuotationValidator']
+__all__ = ['LanguagePairValidator', 'QuotationValidator']
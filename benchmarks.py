@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks for the quotations library
+
+Usage:
+    python benchmarks.py [name ...]
+
+Runs every benchmark when no name is given.
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_python(code, repeat):
+    """ Returns the sorted wall times (in ms) of running code in fresh interpreters """
+    import time
+
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", code], cwd=ROOT)
+        timings.append((time.time() - start) * 1000.0)
+    return sorted(timings)
+
+
+def bench_import(repeat=20):
+    """ Cold start cost of importing the core library in a fresh interpreter """
+    baseline = _run_python("pass", repeat)
+    library = _run_python("import quotations", repeat)
+    with_re = _run_python("import re, quotations", repeat)
+
+    output = subprocess.check_output(
+        [sys.executable, "-c",
+         "import sys; before = set(sys.modules); import quotations; "
+         "print(' '.join(sorted(set(sys.modules) - before)))"],
+        cwd=ROOT
+    ).decode('utf-8')
+    modules = output.split()
+
+    print(u"import quotations: median {:.2f}ms over interpreter start, {:.2f}ms when re is imported as well".format(
+        library[repeat // 2] - baseline[repeat // 2],
+        with_re[repeat // 2] - baseline[repeat // 2],
+    ))
+    print(u"modules imported ({}): {}".format(len(modules), u" ".join(modules)))
+
+
+def _corpus(segments=5000, seed=0):
+    """ Returns French (source, translation) segments, a third of them with quotations """
+    import random
+
+    rng = random.Random(seed)
+    words = u"le chat de la voisine est assis sur un mur très haut depuis ce matin".split()
+    corpus = []
+    for _ in range(segments):
+        sentence = u" ".join(rng.choice(words) for _ in range(rng.randint(5, 40)))
+        if rng.random() < 0.33:
+            corpus.append((u"'{},' she said.".format(sentence), u"«{}», dit-elle.".format(sentence)))
+        else:
+            corpus.append((sentence, sentence))
+    return corpus
+
+
+def _character_loop(text, lc):
+    """ Scan of QuotationExtractor.extract before it skipped text with a regular expression """
+    from libs import is_word_character
+    from utils import LONE_RANGERS, QUOTATION_MAP
+
+    count = 0
+    for index, char in enumerate(text):
+        if char in QUOTATION_MAP[lc]:
+            if char in LONE_RANGERS and index > 0 and is_word_character(text[index - 1]):
+                continue
+            count += 1
+    return count
+
+
+def _best(function, repeat):
+    import time
+
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def bench_extract(repeat=5):
+    """ Scanning and validation throughput, per segment """
+    from libs import QuotationExtractor
+    from quotations import LanguagePairValidator, QuotationValidator
+
+    corpus = _corpus()
+    translations = [translation for _, translation in corpus]
+    per_segment = 1000000.0 / len(corpus)
+
+    timings = [
+        ("character loop", lambda: [_character_loop(text, "fr") for text in translations]),
+        ("QuotationExtractor.extract", lambda: [len(QuotationExtractor(text, "fr")) for text in translations]),
+        ("LanguagePairValidator scan", lambda: [
+            LanguagePairValidator.extract_quotations(text, "fr") for text in translations]),
+        ("QuotationValidator.validate strict", lambda: [
+            QuotationValidator.validate(source, translation, "en_fr", strict=True) for source, translation in corpus]),
+        ("validate_batch strict", lambda: list(QuotationValidator.validate_batch(corpus, "en_fr", strict=True))),
+    ]
+    print(u"python {}.{}".format(*sys.version_info[:2]))
+    for name, function in timings:
+        print(u"{:<40} {:8.2f}us/segment".format(name, _best(function, repeat) * per_segment))
+
+
+BENCHMARKS = {
+    "extract": bench_extract,
+    "import": bench_import,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import hashlib
+import os
+import sqlite3
+
+import constants
+import errors
+from quotations import QuotationValidator
+from utils import LONE_RANGERS, QUOTATION_MAP
+
+
+def ruleset_fingerprint():
+    """ Returns a digest of everything validation results depend on
+
+    Changes whenever QUOTATION_MAP, LONE_RANGERS or RULESET_VERSION changes. Cached results
+    include error messages, so RULESET_VERSION is bumped when their format changes too.
+    """
+    digest = hashlib.sha1()
+    digest.update(u"{}\0".format(constants.RULESET_VERSION).encode('utf-8'))
+    for lc in sorted(QUOTATION_MAP):
+        digest.update(u"{}\0{}\0".format(lc, QUOTATION_MAP[lc]).encode('utf-8'))
+    digest.update(LONE_RANGERS.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ValidationCache(object):
+    """ On-disk cache of validation results, backed by SQLite
+
+    Results are keyed by a hash of the segment content, language pair and strict flag.
+    All entries are dropped when opened with a different ruleset fingerprint.
+    """
+
+    def __init__(self, path, fingerprint=None, commit_every=1000):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.fingerprint = fingerprint or ruleset_fingerprint()
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, ok INTEGER, error TEXT, message TEXT)"
+        )
+        row = self._connection.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint:
+            # rules changed; cached results can no longer be trusted
+            self._connection.execute("DELETE FROM results")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)", (self.fingerprint,)
+            )
+        self._connection.commit()
+
+    @staticmethod
+    def key(source, translation, language_pair, strict=False):
+        """ Returns the cache key of a segment """
+        digest = hashlib.sha1()
+        for part in (language_pair, u"1" if strict else u"0", source, translation):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """ Returns (ok, validation_error) of a cached key, or None if unknown """
+        row = self._connection.execute("SELECT ok, error, message FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        ok, error, message = row
+        if ok:
+            return True, ""
+
+        error_class = getattr(errors, error, errors.QuotationValidationError)
+        return False, error_class(message) if message is not None else error_class()
+
+    def set(self, key, ok, error=None):
+        """ Stores the (ok, validation_error) result of a key """
+        error_name = message = None
+        if not ok:
+            error_name = type(error).__name__
+            message = error.args[0] if error.args else None
+            if isinstance(message, bytes):
+                message = message.decode('utf-8')
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results (key, ok, error, message) VALUES (?, ?, ?, ?)",
+            (key, 1 if ok else 0, error_name, message)
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def validate(self, source, translation, language_pair, verbose=False, strict=False):
+        """ Same as QuotationValidator.validate, skipping segments validated before """
+        key = self.key(source, translation, language_pair, strict=strict)
+        result = self.get(key)
+        if result is None:
+            self.misses += 1
+            result = QuotationValidator.validate(source, translation, language_pair, verbose=True, strict=strict)
+            self.set(key, *result)
+        else:
+            self.hits += 1
+
+        return result if verbose else result[0]
+
+    def commit(self):
+        self._connection.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
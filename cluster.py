@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+""" Sharded validation of a corpus by worker processes
+
+The coordinator splits a corpus (see runner) into byte range shards aligned to
+lines and hands them out to workers over sockets. Workers are started locally
+by the coordinator or, on other nodes, with `python cluster.py work HOST:PORT`;
+both sides then share the authkey of QUOTATIONS_CLUSTER_AUTHKEY, and every node
+must see the corpus at the same path. Shards of workers that die, or hang for
+longer than shard_timeout, are handed to another worker.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from reports import ValidationReport
+from runner import SegmentValidator, iter_records
+
+
+def split_shards(path, shards):
+    """ Returns a list of (start, end) byte ranges of path, each starting at a line """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as f:
+        for index in range(1, shards):
+            offset = max(size * index // shards, boundaries[-1])
+            if offset >= size:
+                break
+            f.seek(offset)
+            if offset:
+                # move to the start of the next line
+                f.seek(offset - 1)
+                f.readline()
+            boundaries.append(f.tell())
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def connect(address, authkey):
+    """ Returns a connection to the coordinator, after telling it which host and process this worker is """
+    connection = Client(address, authkey=authkey)
+    connection.send(("ready", socket.gethostname(), os.getpid()))
+    return connection
+
+
+def worker(address, authkey):
+    """ Validates shards received from the coordinator until told to stop """
+    connection = connect(address, authkey)
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == "stop":
+                break
+
+            _, path, start, end, language_pair, strict, top = message
+            report = ValidationReport(top=top)
+            with open(path, "rb") as f:
+                for _ in SegmentValidator(language_pair, strict=strict).run(iter_records(f, start, end), report):
+                    pass
+            connection.send(report.to_dict())
+    finally:
+        connection.close()
+
+
+class Coordinator(object):
+    """ Validates a corpus with a pool of worker processes, merging their reports """
+
+    def __init__(self, path, language_pair=None, strict=False, workers=2, shards=None, top=10,
+                 address=("localhost", 0), worker=worker, worker_args=(), authkey=None, shard_timeout=3600):
+        """ worker(address, authkey, *worker_args) is run in every local worker process
+
+        workers is the number of local worker processes; with 0, shards only go to
+        external workers, which need the same authkey (random by default, so only
+        local workers can connect). A worker that does not answer a shard within
+        shard_timeout seconds (None to wait forever) is dropped and its shard is
+        handed to another worker.
+        """
+        self.path = os.path.abspath(path)
+        self.language_pair = language_pair
+        self.strict = strict
+        self.workers = workers
+        self.shards = shards or max(workers, 1) * 4
+        self.top = top
+        self.address = address
+        self.worker = worker
+        self.worker_args = tuple(worker_args)
+        self.authkey = authkey or os.urandom(16)
+        self.shard_timeout = shard_timeout
+        self.listener_address = None
+        self.listening = threading.Event()  # set once listener_address is known, e.g. for a port of 0
+        self.spawned = 0
+        self.reassigned = 0
+
+    def run(self):
+        """ Returns the merged ValidationReport of every shard """
+        listener = Listener(self.address, authkey=self.authkey)
+        self.listener_address = listener.address
+        self.listening.set()
+
+        shards = split_shards(self.path, self.shards)
+        pending = list(shards)
+        report = ValidationReport(top=self.top)
+        state = {"done": 0}
+        hung = set()  # (host, pid) of workers dropped for exceeding shard_timeout
+        lock = threading.Condition()
+
+        def serve(connection):
+            try:
+                _, host, pid = connection.recv()
+            except (EOFError, IOError, OSError):
+                connection.close()
+                return
+
+            while True:
+                with lock:
+                    if not pending:
+                        break
+                    start, end = pending.pop()
+                try:
+                    connection.send(("shard", self.path, start, end, self.language_pair, self.strict, self.top))
+                    answered = connection.poll(self.shard_timeout)
+                    if answered:
+                        result = connection.recv()
+                except (EOFError, IOError, OSError):
+                    answered = None  # worker died
+                if not answered:
+                    # give its shard to somebody else
+                    with lock:
+                        pending.append((start, end))
+                        self.reassigned += 1
+                        if answered is not None:
+                            hung.add((host, pid))
+                        lock.notify_all()
+                    connection.close()
+                    return
+
+                with lock:
+                    report.merge(ValidationReport.from_dict(result))
+                    state["done"] += 1
+                    lock.notify_all()
+            try:
+                connection.send(("stop",))
+            except (IOError, OSError):
+                pass
+            connection.close()
+
+        def accept():
+            while True:
+                try:
+                    connection = listener.accept()
+                except (EOFError, IOError, OSError):
+                    return
+                thread = threading.Thread(target=serve, args=(connection,))
+                thread.daemon = True
+                thread.start()
+
+        acceptor = threading.Thread(target=accept)
+        acceptor.daemon = True
+        acceptor.start()
+
+        processes = []
+        try:
+            host = socket.gethostname()
+            with lock:
+                while state["done"] < len(shards):
+                    for process in processes:
+                        if (host, process.pid) in hung and process.is_alive():
+                            process.terminate()
+                            process.join(1)
+                    processes = [process for process in processes if process.is_alive()]
+                    # once every shard is handed out, stopped workers are not replaced; shards of
+                    # workers that die or hang go back to pending and get new workers
+                    while pending and len(processes) < self.workers:
+                        process = multiprocessing.Process(target=self.worker,
+                                                          args=(listener.address, self.authkey) + self.worker_args)
+                        process.daemon = True
+                        process.start()
+                        processes.append(process)
+                        self.spawned += 1
+                    lock.wait(0.1)
+        finally:
+            listener.close()
+            deadline = time.time() + 5
+            for process in processes:
+                process.join(max(0, deadline - time.time()))
+                if process.is_alive():
+                    process.terminate()
+
+        return report
+
+
+def _address(value):
+    host, _, port = value.rpartition(":")
+    return host or "localhost", int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a corpus with workers on one or more nodes; "
+                                                 "set QUOTATIONS_CLUSTER_AUTHKEY on every node")
+    commands = parser.add_subparsers(dest="command")
+    coordinate = commands.add_parser("coordinate", help="hand out shards and print the merged report")
+    coordinate.add_argument("path")
+    coordinate.add_argument("language_pair", nargs="?")
+    coordinate.add_argument("--address", type=_address, default=("localhost", 0), help="HOST:PORT to listen on")
+    coordinate.add_argument("--workers", type=int, default=2, help="local worker processes")
+    coordinate.add_argument("--shards", type=int)
+    coordinate.add_argument("--strict", action="store_true")
+    coordinate.add_argument("--shard-timeout", type=float, default=3600)
+    work = commands.add_parser("work", help="validate shards of a coordinator")
+    work.add_argument("address", type=_address, help="HOST:PORT of the coordinator")
+    arguments = parser.parse_args(argv)
+
+    authkey = os.environ.get("QUOTATIONS_CLUSTER_AUTHKEY")
+    authkey = authkey.encode("utf-8") if authkey else None
+    if arguments.command == "work":
+        if authkey is None:
+            parser.error("QUOTATIONS_CLUSTER_AUTHKEY is not set")
+        worker(arguments.address, authkey)
+    elif arguments.command == "coordinate":
+        coordinator = Coordinator(arguments.path, arguments.language_pair, strict=arguments.strict,
+                                  workers=arguments.workers, shards=arguments.shards, address=arguments.address,
+                                  authkey=authkey, shard_timeout=arguments.shard_timeout)
+        print(json.dumps(coordinator.run().to_dict(), indent=2, sort_keys=True))
+    else:
+        parser.error("a command is required")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+""" Compact columnar storage of validation results
+
+A result set is a directory of fixed width column files, plus a string pool:
+
+    index.col          int64   segment index
+    offset.col         int64   offset of the segment in its input, -1 if unknown
+    status.col         uint8   1 if the segment passed validation, else 0
+    error.col          uint8   position of the error class in ERROR_CLASSES, 0 if none
+    message.col        uint32  line of the error message in strings.ndjson, 0 if none
+    language_pair.col  uint32  line of the language pair in strings.ndjson, 0 if none
+    strings.ndjson             string pool, a JSON string per line
+    meta.json                  column formats, and the row count once closed
+
+Columns are little endian whatever the platform, appended to as results come
+in, and memory mapped when read. A result set still being written (or left by
+a crashed run) can be read; its rows are counted from the column files.
+Parallel runs write one directory per worker.
+"""
+from __future__ import absolute_import
+
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+
+from compat import PY2
+
+ERROR_CLASSES = (
+    None,
+    "QuotationValidationError",
+    "LanguageNotSupported",
+    "QuotationNotFound",
+    "QuotationMissingPair",
+    "TranslatedQuotationAmountDifference",
+    "TranslatedQuotationWrongOrder",
+)
+
+# struct formats with an explicit byte order and size; array typecodes vary in size across platforms
+COLUMNS = (
+    ("index", '<q'),
+    ("offset", '<q'),
+    ("status", '<B'),
+    ("error", '<B'),
+    ("message", '<I'),
+    ("language_pair", '<I'),
+)
+
+VERSION = 2
+
+
+def _write_meta(directory, rows):
+    """ Writes meta.json; rows is None while the result set is being written """
+    path = os.path.join(directory, "meta.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump({
+            "version": VERSION,
+            "rows": rows,
+            "columns": dict(COLUMNS),
+            "error_classes": ERROR_CLASSES,
+        }, f)
+    os.rename(path + ".tmp", path)
+
+
+class ColumnarWriter(object):
+    """ Appends validation results to a columnar result set """
+
+    def __init__(self, directory, flush_every=4096):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.flush_every = flush_every
+        self.rows = 0
+        self._columns = dict((name, []) for name, _ in COLUMNS)
+        self._files = dict((name, open(os.path.join(directory, "{}.col".format(name)), "wb")) for name, _ in COLUMNS)
+        self._strings_file = io.open(os.path.join(directory, "strings.ndjson"), "w", encoding='utf-8')
+        self._strings = {}
+        self._error_codes = dict((name, code) for code, name in enumerate(ERROR_CLASSES))
+        _write_meta(directory, None)
+
+    def _string(self, value):
+        if value is None:
+            return 0
+        try:
+            return self._strings[value]
+        except KeyError:
+            self._strings_file.write(u"{}\n".format(json.dumps(value)))
+            string_id = self._strings[value] = len(self._strings) + 1
+            return string_id
+
+    def write(self, index, result, offset=-1, language_pair=None):
+        """ Appends a (verbose or not) validate result """
+        if isinstance(result, tuple):
+            ok, error = result
+        else:
+            ok, error = result, None
+
+        error_code = message = 0
+        if not ok and error is None:
+            error_code = 1  # failed without an error, as with a non verbose result: QuotationValidationError
+        elif not ok:
+            error_code = self._error_codes.get(type(error).__name__, 1)
+            text = error.args[0] if error.args else None
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            message = self._string(text)
+
+        columns = self._columns
+        columns["index"].append(index)
+        columns["offset"].append(offset)
+        columns["status"].append(1 if ok else 0)
+        columns["error"].append(error_code)
+        columns["message"].append(message)
+        columns["language_pair"].append(self._string(language_pair))
+        self.rows += 1
+
+        if len(columns["index"]) >= self.flush_every:
+            self.flush()
+
+    def write_many(self, results, language_pair=None, start=0):
+        """ Appends results of e.g. QuotationValidator.validate_batch, indexed from start """
+        for index, result in enumerate(results, start):
+            self.write(index, result, language_pair=language_pair)
+
+    def flush(self):
+        # strings first, so that flushed rows never refer to a string not written yet
+        self._strings_file.flush()
+        for name, fmt in COLUMNS:
+            column = self._columns[name]
+            if column:
+                self._files[name].write(struct.pack("{}{}{}".format(fmt[0], len(column), fmt[1:]), *column))
+                del column[:]
+            self._files[name].flush()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._strings_file.close()
+        _write_meta(self.directory, self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ColumnarReader(object):
+    """ Reads a columnar result set
+
+    On little endian Python 3 columns are memoryviews over memory mapped files
+    (no copy); elsewhere they are tuples unpacked from the mapped files.
+    Without a row count in meta.json (the writer is not closed, or meta.json is
+    missing) only the rows complete in every column file are read.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        path = os.path.join(directory, "meta.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"version": VERSION, "rows": None, "columns": dict(COLUMNS), "error_classes": ERROR_CLASSES}
+        if self.meta["version"] != VERSION:
+            raise ValueError(u"result set version {} is not supported".format(self.meta["version"]))
+
+        self.rows = self.meta["rows"]
+        if self.rows is None:
+            self.rows = min(os.path.getsize(self._path(name)) // struct.calcsize(fmt)
+                            for name, fmt in self.meta["columns"].items())
+
+        self._maps = []
+        self._views = []
+        self.columns = {}
+        for name, fmt in self.meta["columns"].items():
+            self.columns[name] = self._column(self._path(name), fmt)
+        self._strings = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, "{}.col".format(name))
+
+    def _column(self, path, fmt):
+        size = self.rows * struct.calcsize(fmt)
+        if not size:
+            return ()
+
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(data)
+        if not PY2 and fmt[0] == '<' and sys.byteorder == 'little':
+            view = memoryview(data)[:size].cast(fmt[1:])
+            self._views.append(view)
+            return view
+        return struct.unpack_from("{}{}{}".format(fmt[0], self.rows, fmt[1:]), data)
+
+    @property
+    def strings(self):
+        """ The string pool, loaded on first use; a line still being written is left out """
+        if self._strings is None:
+            with io.open(os.path.join(self.directory, "strings.ndjson"), encoding='utf-8') as f:
+                self._strings = [None] + [json.loads(line) for line in f if line.endswith(u"\n")]
+        return self._strings
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        """ Returns a row as a dict """
+        columns = self.columns
+        return {
+            "index": columns["index"][row],
+            "offset": columns["offset"][row],
+            "ok": bool(columns["status"][row]),
+            "error": self.meta["error_classes"][columns["error"][row]],
+            "message": self.strings[columns["message"][row]],
+            "language_pair": self.strings[columns["language_pair"][row]],
+        }
+
+    def __iter__(self):
+        for row in range(self.rows):
+            yield self[row]
+
+    def close(self):
+        """ Unmaps the columns; columns still held by the caller can no longer be read """
+        self.columns = {}
+        for view in self._views:
+            view.release()  # a map cannot be closed while a view exports it
+        self._views = []
+        for data in self._maps:
+            data.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
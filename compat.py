@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    unichr = unichr
+else:
+    unichr = chr
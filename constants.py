@@ -10,3 +10,7 @@ LC_SPANISH_LATIN = 'es_la'
 LC_THAI = 'th'
 LC_CHINESE = 'zh'
 LC_CHINESE_TRADITIONAL = 'zh_tw'
+
+# bump whenever validation rules or error messages change in a way that affects results
+# 2: quotations in error messages are listed as characters
+RULESET_VERSION = 2
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division
+
+import constants
+from utils import NEUTRAL_QUOTATIONS, QUOTATION_MAP
+
+# language code reported for a quotation convention shared by several languages
+PREFERRED_CODES = (constants.LC_ENGLISH, constants.LC_FRENCH, constants.LC_GERMAN, constants.LC_JAPANESE,
+                   constants.LC_THAI)
+
+
+def quotation_conventions():
+    """ Returns a dict of quotation convention (its non neutral quotations) to a representative language code """
+    conventions = {}
+    for lc in sorted(QUOTATION_MAP):
+        alphabet = u"".join(sorted(set(QUOTATION_MAP[lc]) - set(NEUTRAL_QUOTATIONS)))
+        conventions.setdefault(alphabet, []).append(lc)
+
+    def representative(lcs):
+        preferred = [lc for lc in PREFERRED_CODES if lc in lcs]
+        return preferred[0] if preferred else lcs[0]
+
+    return dict((alphabet, representative(lcs)) for alphabet, lcs in conventions.items())
+
+
+class QuotationStyleDetector(object):
+    """ Infers the quotation convention, as a language code, of texts without locale metadata
+
+    Builds a histogram of every quotation character of QUOTATION_MAP in one pass,
+    then picks the convention explaining most of it. Decisions are cached per file.
+    """
+
+    def __init__(self, default=constants.LC_ENGLISH):
+        import re
+
+        self.default = default
+        self.conventions = quotation_conventions()
+        characters = set(u"".join(self.conventions))
+        # a quotation shared by several conventions is weaker evidence for each of them
+        self.weights = dict(
+            (char, 1.0 / sum(1 for alphabet in self.conventions if char in alphabet)) for char in characters
+        )
+        self._pattern = re.compile(u"[{}]".format(u"".join(re.escape(char) for char in sorted(characters))))
+        self._cache = {}
+
+    def histogram(self, texts, counts=None):
+        """ Returns a dict of (non neutral) quotation character to its count over texts, added to counts if given """
+        counts = {} if counts is None else counts
+        for text in texts:
+            for char in self._pattern.findall(text):
+                counts[char] = counts.get(char, 0) + 1
+        return counts
+
+    def detect(self, texts):
+        """ Returns the language code of the quotation convention of texts, or default if unclear """
+        return self._decide(self.histogram(texts))
+
+    def _decide(self, counts):
+        best, best_score = self.default, 0.0
+        for alphabet, lc in sorted(self.conventions.items(), key=lambda item: item[1]):
+            score = 0.0
+            for char, count in counts.items():
+                # quotations foreign to a convention count against it
+                score += count * self.weights[char] if char in alphabet else -count
+            if score > best_score:
+                best, best_score = lc, score
+        return best
+
+    def detect_file(self, filename, texts):
+        """ Same as detect, cached by filename """
+        try:
+            return self._cache[filename]
+        except KeyError:
+            lc = self._cache[filename] = self.detect(texts)
+            return lc
+
+    def language_pair(self, filename, segments, source_lc=None):
+        """ Returns the language pair of a file of (source, translation) segments, cached by filename
+
+        segments is iterated at most once, so it may be a generator.
+        """
+        source_key, translation_key = (filename, "source"), (filename, "translation")
+        if source_lc is None:
+            source_lc = self._cache.get(source_key)
+        translation_lc = self._cache.get(translation_key)
+
+        if source_lc is None or translation_lc is None:
+            source_counts, translation_counts = {}, {}
+            for source, translation in segments:
+                if source_lc is None:
+                    self.histogram((source,), source_counts)
+                if translation_lc is None:
+                    self.histogram((translation,), translation_counts)
+            if source_lc is None:
+                source_lc = self._cache[source_key] = self._decide(source_counts)
+            if translation_lc is None:
+                translation_lc = self._cache[translation_key] = self._decide(translation_counts)
+        return u"{}_{}".format(source_lc, translation_lc)
+
+    def forget(self, filename):
+        """ Drops cached decisions of a file, e.g. after it changed """
+        for key in (filename, (filename, "source"), (filename, "translation")):
+            self._cache.pop(key, None)
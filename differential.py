@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+""" Differential testing of alternative validation engines
+
+Every registered engine must give the same result, error message included, as
+the reference: a frozen copy of the original character by character extractor
+and validator, kept apart from the code it checks. Extractor engines must find
+the same quotations (and pair them the same way) as the reference extractor.
+Engines registered with normalize=True are checked against the reference run
+on texts with lookalikes mapped to quotations. Texts are random strings mixing
+the QUOTATION_MAP alphabets of two languages, lookalikes of quotations, lone
+rangers and word characters. Disagreements are minimised before being reported.
+
+Usage:
+    python differential.py [cases] [seed]
+"""
+from __future__ import absolute_import, print_function
+
+import random
+import re
+import sys
+import unicodedata
+
+from cache import ValidationCache
+from errors import (LanguageNotSupported,
+                    QuotationMissingPair,
+                    QuotationValidationError,
+                    TranslatedQuotationAmountDifference,
+                    TranslatedQuotationWrongOrder)
+from libs import QuotationExtractor, quotation_spans, record_quotations
+from quotations import LanguagePairValidator, QuotationValidator
+from utils import CONFUSABLE_QUOTATIONS, LONE_RANGERS, QUOTATION_MAP
+
+ENGINES = {}
+NORMALIZING_ENGINES = {}
+EXTRACTORS = {}
+
+WORD_CHARACTERS = u"aZ9_éあ"
+OTHER_CHARACTERS = u" .,!\n"
+# full-width, half-width and vertical forms of quotations, and a Greek varia (a canonical lookalike of `)
+COMPATIBILITY_CHARACTERS = u"＂＇｀｢｣﹁﹂﹃﹄︽︾\u1fef"
+
+
+def register_engine(name, factory, normalize=False):
+    """ Registers an engine
+
+    factory(language_pair, strict) returns a callable of (source, translation) returning
+    the verbose result of validate; if the callable has a close method, it is called once
+    the case is done. Engines mapping lookalikes to quotations are registered with normalize.
+    """
+    (NORMALIZING_ENGINES if normalize else ENGINES)[name] = factory
+
+
+def register_extractor(name, extractor):
+    """ Registers an extractor engine
+
+    extractor(text, lc) returns a tuple like reference_scan, with None for the parts it does not give.
+    """
+    EXTRACTORS[name] = extractor
+
+
+# The reference is frozen: it must not share code with the engines it checks.
+
+_WORD_CHARACTER = re.compile(r"\w")
+
+
+def reference_scan(text, lc):
+    """ Returns (offsets, positions, spans, unmatched) of the quotations of text
+
+    Quotations are found character by character, as the original QuotationExtractor did;
+    positions are in QUOTATION_MAP[lc]. Spans are (start, end, depth) of matched pairs in
+    the order they open, unmatched the offsets of the quotations left on the stack.
+    """
+    quotations = QUOTATION_MAP[lc]
+    offsets = []
+    positions = []
+    closed = True
+    for index, char in enumerate(text):
+        if char in quotations:
+            if char in LONE_RANGERS and index > 0 and _WORD_CHARACTER.match(text[index - 1]):
+                continue
+            closed = not closed
+            position = quotations.index(char)
+            if closed and position % 2 == 0:
+                position += 1
+            offsets.append(index)
+            positions.append(position)
+
+    spans = []
+    stack = []  # (position, offset, depth)
+    for offset, position in zip(offsets, positions):
+        if stack and stack[-1][0] % 2 != position % 2 and abs(stack[-1][0] - position) == 1:
+            _, start, depth = stack.pop()
+            spans.append((start, offset + 1, depth))
+        else:
+            stack.append((position, offset, len(stack)))
+    return offsets, positions, sorted(spans), [offset for _, offset, _ in stack]
+
+
+def _reference_characters(lc, positions):
+    return u"[{}]".format(u", ".join(QUOTATION_MAP[lc][position] for position in positions))
+
+
+def _reference_normalize(text, lc):
+    """ Returns text with lookalikes mapped to quotations of lc, one character for one """
+    quotations = QUOTATION_MAP[lc]
+    characters = []
+    for char in text:
+        candidates = [candidate for candidate in CONFUSABLE_QUOTATIONS.get(char, u"") if candidate in quotations]
+        if candidates:
+            char = candidates[0]
+        elif unicodedata.decomposition(char).startswith(u"<"):
+            canonical = unicodedata.normalize('NFKC', char)
+            if len(canonical) == 1 and canonical in quotations:
+                char = canonical
+        characters.append(char)
+    return u"".join(characters)
+
+
+def _reference_split(language_pair):
+    parts = language_pair.split("_")
+    for index in range(1, len(parts)):
+        source_lc, translation_lc = "_".join(parts[:index]), "_".join(parts[index:])
+        if source_lc in QUOTATION_MAP and translation_lc in QUOTATION_MAP:
+            return source_lc, translation_lc
+    raise LanguageNotSupported(u"[{}] language pair is not supported".format(language_pair))
+
+
+def reference_validate(source, translation, language_pair, strict=False, normalize=False):
+    """ Returns the verbose result of the original QuotationValidator.validate
+
+    With normalize, compatibility variants and CONFUSABLE_QUOTATIONS count as quotations.
+    """
+    try:
+        source_lc, translation_lc = _reference_split(language_pair)
+        if normalize:
+            source = _reference_normalize(source, source_lc)
+            translation = _reference_normalize(translation, translation_lc)
+        _, translation_positions, _, _ = reference_scan(translation, translation_lc)
+        stack = []
+        for position in translation_positions:
+            if stack and stack[-1] % 2 != position % 2 and abs(stack[-1] - position) == 1:
+                stack.pop()
+            else:
+                stack.append(position)
+        if stack:
+            raise QuotationMissingPair(u"there are orphaned quotations: {}".format(
+                _reference_characters(translation_lc, stack)))
+
+        if strict:
+            _, source_positions, _, _ = reference_scan(source, source_lc)
+            if len(source_positions) != len(translation_positions):
+                raise TranslatedQuotationAmountDifference(
+                    u"total quotations of source ({}) and translation ({}) is different.".format(
+                        _reference_characters(source_lc, source_positions),
+                        _reference_characters(translation_lc, translation_positions)))
+            for source_position, translation_position in zip(source_positions, translation_positions):
+                if source_position % 2 != translation_position % 2:
+                    raise TranslatedQuotationWrongOrder(u"differing order in quotation: source ({}), target ({})".format(
+                        QUOTATION_MAP[source_lc][source_position], QUOTATION_MAP[translation_lc][translation_position]))
+    except QuotationValidationError as e:
+        return False, e
+    return True, ""
+
+
+def reference(language_pair, strict, normalize=False):
+    return lambda source, translation: reference_validate(source, translation, language_pair, strict=strict,
+                                                          normalize=normalize)
+
+
+def _validate(language_pair, strict, normalize=False):
+    return lambda source, translation: QuotationValidator.validate(
+        source, translation, language_pair, verbose=True, strict=strict, normalize=normalize)
+
+
+def _language_pair_validator(language_pair, strict, normalize=False):
+    validator = LanguagePairValidator(language_pair, strict=strict, normalize=normalize)
+    return lambda source, translation: validator.validate(source, translation, verbose=True)
+
+
+def _batch(language_pair, strict, normalize=False):
+    return lambda source, translation: next(QuotationValidator.validate_batch(
+        [(source, translation)], language_pair, verbose=True, strict=strict, normalize=normalize))
+
+
+def _source_quotations(language_pair, strict):
+    validator = LanguagePairValidator(language_pair, strict=strict)
+
+    def validate(source, translation):
+        return validator.validate(source, translation, verbose=True, source_quotations=(
+            LanguagePairValidator.extract_quotations(source, validator.source_lc) if strict else None))
+    return validate
+
+
+class _Cache(object):
+
+    def __init__(self, language_pair, strict):
+        self.language_pair = language_pair
+        self.strict = strict
+        self.cache = ValidationCache(":memory:")
+
+    def __call__(self, source, translation):
+        return self.cache.validate(source, translation, self.language_pair, verbose=True, strict=self.strict)
+
+    def close(self):
+        self.cache.close()
+
+
+def _extract(text, lc):
+    return None, [quotation._position for quotation in QuotationExtractor(text, lc).extract()], None, None
+
+
+def _scan(text, lc):
+    offsets, positions = record_quotations(text, lc)
+    return offsets, positions, None, None
+
+
+def _spans(text, lc):
+    spans = quotation_spans(text, lc)
+    return None, None, sorted(spans), list(spans.unmatched)
+
+
+register_engine("QuotationValidator.validate", _validate)
+register_engine("LanguagePairValidator", _language_pair_validator)
+register_engine("validate_batch", _batch)
+register_engine("source_quotations", _source_quotations)
+register_engine("ValidationCache", _Cache)
+register_engine("QuotationValidator.validate", lambda *args: _validate(*args, normalize=True), normalize=True)
+register_engine("LanguagePairValidator", lambda *args: _language_pair_validator(*args, normalize=True),
+                normalize=True)
+register_engine("validate_batch", lambda *args: _batch(*args, normalize=True), normalize=True)
+
+register_extractor("QuotationExtractor.extract", _extract)
+register_extractor("scan_quotations", _scan)
+register_extractor("quotation_spans", _spans)
+
+
+def random_text(rng, lc, length):
+    """ Returns a random text mostly of the alphabet of a language, with quotations of another and lookalikes """
+    other_lc = rng.choice(sorted(QUOTATION_MAP))
+    alphabet = (QUOTATION_MAP[lc] * 2 + QUOTATION_MAP[other_lc] + u"".join(CONFUSABLE_QUOTATIONS) +
+                COMPATIBILITY_CHARACTERS + LONE_RANGERS + WORD_CHARACTERS + OTHER_CHARACTERS)
+    return u"".join(rng.choice(alphabet) for _ in range(rng.randint(0, length)))
+
+
+def _message(error):
+    message = error.args[0] if error.args else u""
+    return message.decode('utf-8') if isinstance(message, bytes) else message
+
+
+def outcome(engine, source, translation):
+    """ Returns the comparable part of the result of an engine; exceptions raised are outcomes too """
+    try:
+        ok, error = engine(source, translation)
+    except Exception as e:
+        return "raised", type(e).__name__, _message(e)
+    return (ok, None, None) if ok else (ok, type(error).__name__, _message(error))
+
+
+def extraction(extractor, text, lc):
+    """ Returns the parts of reference_scan given by an extractor, and the same parts of the reference """
+    try:
+        actual = extractor(text, lc)
+    except Exception as e:
+        return ("raised", type(e).__name__, _message(e)), None
+    expected = reference_scan(text, lc)
+    return (tuple(part for part in actual if part is not None),
+            tuple(part for part, given in zip(expected, actual) if given is not None))
+
+
+def minimise(text, fails):
+    """ Returns the shortest text found by removing characters while fails(text) stays True """
+    chunk = max(len(text) // 2, 1)
+    while chunk:
+        index = 0
+        while index < len(text):
+            candidate = text[:index] + text[index + chunk:]
+            if fails(candidate):
+                text = candidate
+            else:
+                index += chunk
+        chunk //= 2
+    return text
+
+
+def _minimised(engine, expected, source, translation):
+    """ Returns the (source, translation) minimised while engine disagrees with expected, or None if they agree """
+    def fails(source, translation):
+        return outcome(engine, source, translation) != outcome(expected, source, translation)
+
+    if not fails(source, translation):
+        return None
+    source = minimise(source, lambda text: fails(text, translation))
+    translation = minimise(translation, lambda text: fails(source, text))
+    return source, translation
+
+
+def run(cases=500, seed=0, length=20, engines=None, extractors=None, normalizing_engines=None):
+    """ Returns a list of disagreements as dicts, with a minimised source and translation (or text) """
+    rng = random.Random(seed)
+    languages = sorted(QUOTATION_MAP)
+    engines = ENGINES if engines is None else engines
+    extractors = EXTRACTORS if extractors is None else extractors
+    normalizing_engines = NORMALIZING_ENGINES if normalizing_engines is None else normalizing_engines
+    disagreements = []
+
+    for case in range(cases):
+        source_lc, translation_lc = rng.choice(languages), rng.choice(languages)
+        language_pair = u"{}_{}".format(source_lc, translation_lc)
+        strict = rng.random() < 0.5
+        source, translation = random_text(rng, source_lc, length), random_text(rng, translation_lc, length)
+
+        for normalize, registry in ((False, engines), (True, normalizing_engines)):
+            expected = reference(language_pair, strict, normalize=normalize)
+            for name, factory in sorted(registry.items()):
+                engine = factory(language_pair, strict)
+                try:
+                    reproducer = _minimised(engine, expected, source, translation)
+                    if reproducer is not None:
+                        disagreements.append({
+                            "case": case,
+                            "engine": name,
+                            "language_pair": language_pair,
+                            "strict": strict,
+                            "normalize": normalize,
+                            "source": reproducer[0],
+                            "translation": reproducer[1],
+                            "expected": outcome(expected, *reproducer),
+                            "actual": outcome(engine, *reproducer),
+                        })
+                finally:
+                    if hasattr(engine, "close"):
+                        engine.close()
+
+        for name, extractor in sorted(extractors.items()):
+            def differs(text):
+                actual, expected = extraction(extractor, text, translation_lc)
+                return actual != expected
+
+            if differs(translation):
+                text = minimise(translation, differs)
+                actual, expected = extraction(extractor, text, translation_lc)
+                disagreements.append({
+                    "case": case,
+                    "engine": name,
+                    "lc": translation_lc,
+                    "text": text,
+                    "expected": expected,
+                    "actual": actual,
+                })
+    return disagreements
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:3]]
+    disagreements = run(*arguments)
+    for disagreement in disagreements:
+        print(repr(disagreement))
+    print(u"{} disagreement(s)".format(len(disagreements)))
+    sys.exit(1 if disagreements else 0)
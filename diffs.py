@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+""" Validation of the segments touched by a change
+
+Works out which lines were added or modified, from a unified diff (e.g. git diff)
+or from two revisions of a file, and only validates segments on those lines.
+Reading a file stops after its last changed line, and reading a JSON source
+bundle once the sources of the changed keys are found.
+"""
+from __future__ import absolute_import
+
+import collections
+import difflib
+import io
+import os
+import re
+
+from formats import iter_json_strings, iter_po_spans, validate_entries
+
+_HUNK = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_unified_diff(lines):
+    """ Returns an ordered dict of file path to the set of added or modified line numbers
+
+    Paths are taken from +++ headers, without git's b/ prefix; deleted files are left out.
+    Hunks end after the amount of lines given in their @@ header, so that an added
+    line starting with "++ " is not mistaken for a header.
+    """
+    changes = collections.OrderedDict()
+    path = None
+    line_number = 0
+    old_lines = new_lines = 0  # lines of the current hunk still to be read
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip(u"\r\n")
+
+        if old_lines or new_lines:
+            if line.startswith(u"+"):
+                if path is not None:
+                    changes.setdefault(path, set()).add(line_number)
+                line_number += 1
+                new_lines -= 1
+            elif line.startswith(u"-"):
+                old_lines -= 1
+            elif line.startswith(u" ") or line == u"":
+                line_number += 1
+                old_lines -= 1
+                new_lines -= 1
+            continue  # "\ No newline at end of file"
+
+        if line.startswith(u"+++ "):
+            path = line[4:].split(u"\t", 1)[0]
+            if path == u"/dev/null":
+                path = None
+            elif path.startswith(u"b/"):
+                path = path[2:]
+            continue
+
+        hunk = _HUNK.match(line)
+        if hunk:
+            old_count, start, new_count = hunk.groups()
+            line_number = int(start)
+            old_lines = int(old_count) if old_count is not None else 1
+            new_lines = int(new_count) if new_count is not None else 1
+    return changes
+
+
+def changed_lines(old_lines, new_lines):
+    """ Returns the set of line numbers of new_lines added or modified since old_lines """
+    lines = set()
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, _, _, start, end in matcher.get_opcodes():
+        if tag in ("replace", "insert"):
+            lines.update(range(start + 1, end + 1))
+    return lines
+
+
+def iter_changed_po(fileobj, lines):
+    """ Yields (line number, msgid, msgstr) of PO messages touching any of lines """
+    if not lines:
+        return
+    last = max(lines)
+    for first_line, last_line, line_number, source, translation in iter_po_spans(fileobj):
+        if first_line > last:
+            break
+        if any(first_line <= line <= last_line for line in lines):
+            yield line_number, source, translation
+
+
+def iter_changed_json(text, lines):
+    """ Yields (key path, value, line number) of JSON strings on any of lines
+
+    text is the document or a text file object, see iter_json_strings.
+    """
+    if not lines:
+        return
+    last = max(lines)
+    for key, value, line_number in iter_json_strings(text):
+        if line_number > last:
+            break
+        if line_number in lines:
+            yield key, value, line_number
+
+
+def _find_sources(fileobj, keys):
+    """ Returns a dict of key path to source string of keys, reading the source bundle until all are found """
+    keys = set(keys)
+    sources = {}
+    for key, value, _ in iter_json_strings(fileobj):
+        if key in keys:
+            sources[key] = value
+            if len(sources) == len(keys):
+                break
+    return sources
+
+
+def validate_changes(changes, language_pair, root=u".", strict=False, json_sources=None):
+    """ Yields (path, location, ok, validation_error) of every changed segment of supported files
+
+    changes is a dict of path to changed line numbers, e.g. from parse_unified_diff.
+    json_sources is an optional callable of a JSON bundle path to the path of its source bundle.
+    Files of other formats are skipped.
+    """
+    for path, lines in changes.items():
+        full_path = os.path.join(root, path)
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension in (u".po", u".pot"):
+            with open(full_path, "rb") as f:
+                entries = list(iter_changed_po(f, lines))
+        elif extension == u".json":
+            with io.open(full_path, encoding='utf-8') as f:
+                changed = list(iter_changed_json(f, lines))
+            sources = {}
+            source_path = json_sources(path) if json_sources is not None and changed else None
+            if source_path is not None:
+                with io.open(os.path.join(root, source_path), encoding='utf-8') as f:
+                    sources = _find_sources(f, (key for key, _, _ in changed))
+            entries = [(key, sources.get(key, u""), value) for key, value, _ in changed]
+        else:
+            continue
+
+        for location, ok, error in validate_entries(iter(entries), language_pair, strict=strict):
+            yield path, location, ok, error
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+""" Streaming readers for translation file formats
+
+Every reader yields (location, source, translation) entries, where location is
+a line number (PO, subtitles), an entry index (MO) or a key path (JSON bundles).
+Entries are read as the file is consumed; whole documents are never built.
+"""
+from __future__ import absolute_import
+
+import collections
+import io
+import mmap
+import struct
+from json.decoder import scanstring
+
+from quotations import QuotationValidator
+
+
+_PO_ESCAPES = {u"n": u"\n", u"t": u"\t", u"r": u"\r", u"\"": u"\"", u"\\": u"\\", u"a": u"\a", u"b": u"\b",
+               u"f": u"\f", u"v": u"\v"}
+
+
+def _po_string(line):
+    """ Returns the unescaped content of a quoted PO string """
+    start = line.index(u"\"") + 1
+    end = line.rindex(u"\"")
+    text = line[start:end]
+    if u"\\" not in text:
+        return text
+
+    chars = []
+    escaped = False
+    for char in text:
+        if escaped:
+            chars.append(_PO_ESCAPES.get(char, char))
+            escaped = False
+        elif char == u"\\":
+            escaped = True
+        else:
+            chars.append(char)
+    return u"".join(chars)
+
+
+def iter_po(fileobj):
+    """ Yields (line number, msgid, msgstr) of every translated message of a UTF-8 PO file
+
+    Plural forms are yielded once per msgstr[n]; msgstr[0] is paired with msgid and the
+    others with msgid_plural. Obsolete messages and the header are skipped.
+    """
+    for _, _, line_number, source, translation in iter_po_spans(fileobj):
+        yield line_number, source, translation
+
+
+def iter_po_spans(fileobj):
+    """ Same as iter_po, yielding (first line, last line, line number, msgid, msgstr)
+
+    First and last lines are those of the whole message, from msgctxt or msgid to its last msgstr line.
+    """
+    msgid = msgid_plural = None
+    msgstrs = []  # [line number, plural index, parts]
+    current = None  # parts of the string continued by following lines
+    first_line = last_line = None
+
+    def entries():
+        if msgid is None or not msgstrs:
+            return
+        source = u"".join(msgid)
+        if not source:
+            return  # header
+        for line_number, plural, parts in msgstrs:
+            translation = u"".join(parts)
+            if translation:
+                yield (first_line, last_line, line_number,
+                       source if plural == 0 else u"".join(msgid_plural or msgid), translation)
+
+    for line_number, line in enumerate(fileobj, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+
+        if not line or line.startswith(u"#"):
+            current = None
+            continue
+
+        if line.startswith(u"\""):
+            if current is not None:
+                current.append(_po_string(line))
+                last_line = line_number
+            continue
+
+        keyword = line.split(None, 1)[0]
+        if keyword in (u"msgctxt", u"msgid") and msgstrs:
+            for entry in entries():
+                yield entry
+            msgid = msgid_plural = None
+            msgstrs = []
+            first_line = None
+
+        if first_line is None:
+            first_line = line_number
+        last_line = line_number
+
+        current = [_po_string(line)]
+        if keyword == u"msgid":
+            msgid = current
+        elif keyword == u"msgid_plural":
+            msgid_plural = current
+        elif keyword.startswith(u"msgstr"):
+            plural = int(keyword[7:-1]) if keyword.startswith(u"msgstr[") else 0
+            msgstrs.append((line_number, plural, current))
+        else:
+            current = None  # msgctxt
+
+    for entry in entries():
+        yield entry
+
+
+def iter_mo(path):
+    """ Yields (entry index, msgid, msgstr) of every message of a MO file
+
+    The file is memory mapped; only strings of each entry are decoded.
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic = struct.unpack_from("<I", data, 0)[0]
+        order = "<" if magic == 0x950412de else ">"
+        _, count, originals, translations = struct.unpack_from(order + "4I", data, 4)
+
+        for index in range(count):
+            length, offset = struct.unpack_from(order + "2I", data, originals + index * 8)
+            source = data[offset:offset + length].decode('utf-8')
+            length, offset = struct.unpack_from(order + "2I", data, translations + index * 8)
+            translation = data[offset:offset + length].decode('utf-8')
+
+            if u"\x04" in source:
+                source = source.split(u"\x04", 1)[1]  # drop msgctxt
+            if not source:
+                continue  # header
+
+            sources = source.split(u"\0")
+            for plural, text in enumerate(translation.split(u"\0")):
+                if text:
+                    yield index, sources[min(plural, len(sources) - 1)], text
+    finally:
+        data.close()
+
+
+_JSON_WHITESPACE = u" \t\r\n"
+_JSON_DELIMITERS = u",:{}[]" + _JSON_WHITESPACE
+
+
+def iter_json_strings(text, chunk_size=65536):
+    """ Yields (key path, value, line number) of every string value of a JSON document
+
+    text is either the document or a text file object, read chunk_size characters at a
+    time; only the part of the document not scanned yet is kept.
+    Key paths join nested keys (and list indexes) with dots, i18next style.
+    """
+    if hasattr(text, "read"):
+        read = text.read
+        text = u""
+    else:
+        read = None
+
+    path = []
+    containers = []  # True for objects, False for arrays
+    expect_key = False
+    line_number = 1
+    counted = 0
+    index = 0
+
+    while True:
+        if index >= len(text):
+            chunk = read(chunk_size) if read is not None else u""
+            if not chunk:
+                break
+            line_number += text.count(u"\n", counted)
+            text, index, counted = chunk, 0, 0
+
+        char = text[index]
+        if char in _JSON_WHITESPACE or char == u":":
+            index += 1
+        elif char == u",":
+            if containers[-1]:
+                expect_key = True
+            else:
+                path[-1] += 1
+            index += 1
+        elif char == u"{":
+            containers.append(True)
+            path.append(None)
+            expect_key = True
+            index += 1
+        elif char == u"[":
+            containers.append(False)
+            path.append(0)
+            index += 1
+        elif char in u"}]":
+            containers.pop()
+            path.pop()
+            expect_key = False
+            index += 1
+        elif char == u"\"":
+            try:
+                value, end = scanstring(text, index + 1)
+            except ValueError:
+                chunk = read(chunk_size) if read is not None else u""
+                if not chunk:
+                    raise
+                # the string goes on in the next chunk
+                line_number += text.count(u"\n", counted, index)
+                text, index, counted = text[index:] + chunk, 0, 0
+                continue
+
+            if expect_key:
+                path[-1] = value
+                expect_key = False
+            else:
+                line_number += text.count(u"\n", counted, index)
+                counted = index
+                yield u".".join(u"{}".format(key) for key in path), value, line_number
+            index = end
+        else:
+            # numbers, booleans and null
+            while index < len(text) and text[index] not in _JSON_DELIMITERS:
+                index += 1
+
+
+_MISSING = object()
+
+
+def join_sources(entries, sources):
+    """ Yields (key path, source, translation) of (key path, translation, ...) entries
+
+    sources yields (key path, source, ...) of the source bundle, and is read along with
+    entries: keys in the same order cost nothing to hold, others are kept until asked for.
+    Sources not found are left empty.
+    """
+    sources = iter(sources)
+    pending = {}
+    for entry in entries:
+        key = entry[0]
+        source = pending.pop(key, _MISSING)
+        while source is _MISSING:
+            found = next(sources, None)
+            if found is None:
+                break
+            if found[0] == key:
+                source = found[1]
+            else:
+                pending[found[0]] = found[1]
+        yield key, source if source is not _MISSING else u"", entry[1]
+
+
+def iter_json_bundle(path, source_path=None):
+    """ Yields (key path, source, translation) of every string of a JSON locale bundle
+
+    Sources are looked up by key path in source_path when given, else left empty.
+    """
+    with io.open(path, encoding='utf-8') as f:
+        if source_path is None:
+            for key, value, _ in iter_json_strings(f):
+                yield key, u"", value
+            return
+
+        with io.open(source_path, encoding='utf-8') as source_file:
+            for entry in join_sources(iter_json_strings(f), iter_json_strings(source_file)):
+                yield entry
+
+
+def iter_subtitles(fileobj):
+    """ Yields (line number, source, text) of every cue of an SRT or WebVTT file
+
+    Subtitles carry no source, so it is left empty; the line number is that of the
+    first text line of the cue, and lines of a cue are joined with newlines.
+    Blocks without a timing line (the WebVTT header, NOTE, STYLE and REGION blocks) are skipped.
+    """
+    lines = []
+    first_line = None
+    timed = False
+
+    for line_number, line in enumerate(fileobj, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip(u"\r\n")
+        if line_number == 1:
+            line = line.lstrip(u"\ufeff")
+
+        if not line.strip():
+            if timed and lines:
+                yield first_line, u"", u"\n".join(lines)
+            lines = []
+            timed = False
+        elif not timed:
+            # cue number or identifier, until the timing line
+            timed = u"-->" in line
+            first_line = line_number + 1
+        else:
+            lines.append(line)
+
+    if timed and lines:
+        yield first_line, u"", u"\n".join(lines)
+
+
+def validate_entries(entries, language_pair, strict=False):
+    """ Yields (location, ok, validation_error) of every (location, source, translation) entry """
+    locations = collections.deque()
+
+    def segments():
+        for location, source, translation in entries:
+            locations.append(location)
+            yield source, translation
+
+    for ok, error in QuotationValidator.validate_batch(segments(), language_pair, verbose=True, strict=strict):
+        yield locations.popleft(), ok, error
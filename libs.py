@@ -1,37 +1,255 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
-import re
-
 import constants
+from compat import PY2
 from models import Quotation
-from utils import QUOTATION_MAP, LONE_RANGERS
+from utils import (LONE_RANGERS, QUOTATION_MAP, confusable_table, quotation_characters, quotation_pattern,
+                   quotation_table)
+
+
+if PY2:
+    # \w without re.UNICODE only matches ascii word characters on python 2
+    _ASCII_WORD_CHARACTERS = frozenset(u"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+
+    def is_word_character(char):
+        """ Returns True if char would be matched by the \\w regular expression """
+        return char in _ASCII_WORD_CHARACTERS
+else:
+    def is_word_character(char):
+        """ Returns True if char would be matched by the \\w regular expression """
+        return char.isalnum() or char == u"_"
+
+
+def has_quotations(text, lc):
+    """ Returns True if text contains any quotation character of a language
+
+    Only uses substring searches, so quotation free texts skip the character loop of extract.
+    """
+    for char in quotation_characters(lc):
+        if char in text:
+            return True
+    return False
 
 
-ALPHANUMERIC_PATTERN = re.compile('\w')
+class QuotationPrefilter(object):
+    """ Quick reject of quotation free texts, keeping count of how many it let through """
+
+    def __init__(self, *lcs):
+        self.characters = u"".join(sorted(set(u"".join(quotation_characters(lc) for lc in lcs))))
+        self.checked = 0
+        self.accepted = 0
+
+    def accepts(self, text, other=None, segments=1):
+        """ Returns True if text (and other, if given) has no quotation at all
+
+        text may be several segments joined together, counting as that many segments.
+        A rejected batch is not counted, as its segments are expected to be checked one by one next.
+        """
+        for char in self.characters:
+            if char in text or (other is not None and char in other):
+                if segments == 1:
+                    self.checked += 1
+                return False
+        self.checked += segments
+        self.accepted += segments
+        return True
+
+    @property
+    def hit_rate(self):
+        """ Ratio of checked segments accepted without scanning """
+        return float(self.accepted) / self.checked if self.checked else 0.0
+
 
 class QuotationExtractor(object):
 
-    def __init__(self, text, lc=constants.LC_ENGLISH):
+    def __init__(self, text, lc=constants.LC_ENGLISH, normalize=False):
+        """ If normalize is True, lookalikes of quotations (see utils.confusable_table) are extracted too """
+        if normalize and lc in QUOTATION_MAP:
+            text = text.translate(confusable_table(lc))
         self.text = text
         self.lc = lc
 
     def extract(self):
         """ Yields Quotation instance extractable from text """
+        if self.lc not in QUOTATION_MAP:
+            return
+
         closed = True
-        for index, char in enumerate(self.text):
-            if char in QUOTATION_MAP.get(self.lc, []):
-                if char in LONE_RANGERS and index > 0:
-                    prev_char = self.text[index-1]
-                    if ALPHANUMERIC_PATTERN.match(prev_char):
-                        # prev char is a alphabet; highly likely to be a lone ranger, not a true quotation
-                        # ignore lone ranger
-                        continue
-
-                closed = not closed  # toggle to open from start
-                prev = Quotation.create(self.lc, char, force_close=closed)
-                yield prev
+        text = self.text
+        # the regular expression skips over text without quotations in C
+        for match in quotation_pattern(self.lc).finditer(text):
+            index = match.start()
+            char = text[index]
+            if char in LONE_RANGERS and index > 0:
+                prev_char = text[index-1]
+                if is_word_character(prev_char):
+                    # prev char is a alphabet; highly likely to be a lone ranger, not a true quotation
+                    # ignore lone ranger
+                    continue
+
+            closed = not closed  # toggle to open from start
+            prev = Quotation.create(self.lc, char, force_close=closed)
+            yield prev
 
     def __len__(self):
-        return len(list(self.extract()))
+        return scan_quotations(self.text, self.lc, QuotationHandler())
+
+
+class QuotationHandler(object):
+    """ Receives the events of scan_quotations; override the ones needed
+
+    Callbacks get the index of the character in text, the character itself and,
+    for quotations, its position in QUOTATION_MAP (odd positions are closing).
+    A callback returning True stops the scan.
+    """
+
+    def open(self, index, char, position):
+        pass
+
+    def close(self, index, char, position):
+        pass
+
+    def lone_ranger(self, index, char):
+        pass
+
+
+def scan_quotations(text, lc, handler, normalize=False, closed=True):
+    """ Calls handler for every quotation of text, as QuotationExtractor.extract would yield them
+
+    No Quotation instance is built, so counters and custom rules run at the speed of the scan.
+    Set closed to False to carry on from a previous text whose last quotation was an opening one.
+    Returns the amount of quotations reported.
+    """
+    if lc not in QUOTATION_MAP:
+        return 0
+    if normalize:
+        text = text.translate(confusable_table(lc))
+
+    table = quotation_table(lc)
+    on_open, on_close, on_lone_ranger = handler.open, handler.close, handler.lone_ranger
+    count = 0
+    for match in quotation_pattern(lc).finditer(text):
+        index = match.start()
+        char = text[index]
+        if index and char in LONE_RANGERS and is_word_character(text[index - 1]):
+            if on_lone_ranger(index, char):
+                break
+            continue
+
+        position = table[char]
+        closed = not closed
+        count += 1
+        if closed or position % 2:
+            if closed and position % 2 == 0:
+                position += 1  # forced from open to close
+            if on_close(index, char, position):
+                break
+        elif on_open(index, char, position):
+            break
+    return count
+
+
+class QuotationSpans(object):
+    """ Matched quotation pairs of a text, as parallel int arrays
+
+    Span i goes from starts[i] to ends[i] (exclusive, so text[starts[i]:ends[i]]
+    includes both quotations) at nesting depth depths[i], 0 being outermost.
+    Spans are in the order of their opening quotation. Quotations left without a
+    complement are in unmatched (offsets) and unmatched_positions (QUOTATION_MAP positions).
+    """
+
+    __slots__ = ('starts', 'ends', 'depths', 'unmatched', 'unmatched_positions')
+
+    def __init__(self):
+        # array is imported here, as it pulls in collections on python 3
+        from array import array
+
+        self.starts = array('i')
+        self.ends = array('i')
+        self.depths = array('i')
+        self.unmatched = array('i')
+        self.unmatched_positions = array('i')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        """ Yields (start, end, depth) of every span """
+        return iter(zip(self.starts, self.ends, self.depths))
+
+
+class _Recorder(QuotationHandler):
+
+    def __init__(self):
+        self.offsets = []
+        self.positions = []
+
+    def quotation(self, index, char, position):
+        self.offsets.append(index)
+        self.positions.append(position)
+
+    open = close = quotation
+
+
+def record_quotations(text, lc, normalize=False, closed=True):
+    """ Returns (offsets, QUOTATION_MAP positions) lists of the quotations of text, see scan_quotations """
+    recorder = _Recorder()
+    scan_quotations(text, lc, recorder, normalize=normalize, closed=closed)
+    return recorder.offsets, recorder.positions
+
+
+def pair_quotations(positions, count, stack, paired=None):
+    """ Pairs quotations with the stack of QuotationValidator.validate_open_close
+
+    positions holds the QUOTATION_MAP positions of quotations in text order; a quotation
+    is paired with the one on top of the stack if it is its complement, else stacked.
+    stack is scratch space for at least count items; it is left holding the indexes
+    (in positions) of unmatched quotations, bottom first. paired(opening index,
+    closing index, depth) is called for every pair when given.
+    Returns the amount of unmatched quotations.
+    """
+    top = 0
+    index = 0
+    while index < count:
+        position = positions[index]
+        if top:
+            previous = positions[stack[top - 1]]
+            if previous % 2 != position % 2 and abs(previous - position) == 1:
+                # found complement
+                top -= 1
+                if paired is not None:
+                    paired(stack[top], index, top)
+                index += 1
+                continue
+
+        stack[top] = index
+        top += 1
+        index += 1
+    return top
+
+
+def quotation_spans(text, lc, normalize=False):
+    """ Returns the QuotationSpans of text, pairing quotations in a single scan """
+    offsets, positions = record_quotations(text, lc, normalize=normalize)
+    count = len(positions)
+    ends = [-1] * count
+    depths = [0] * count
+
+    def paired(opening, closing, depth):
+        ends[opening] = offsets[closing] + 1
+        depths[opening] = depth
+
+    stack = [0] * count
+    top = pair_quotations(positions, count, stack, paired)
 
+    spans = QuotationSpans()
+    for index in range(count):
+        if ends[index] != -1:
+            spans.starts.append(offsets[index])
+            spans.ends.append(ends[index])
+            spans.depths.append(depths[index])
+    for index in stack[:top]:
+        spans.unmatched.append(offsets[index])
+        spans.unmatched_positions.append(positions[index])
+    return spans
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+""" Load generator for the validation server
+
+Usage:
+    python loadtest.py http://localhost:5000 [--concurrency 8] [--requests 2000]
+                       [--baseline baseline.json] [--save-baseline]
+    python loadtest.py http://localhost:5000 --p99-budget 50 [--max-concurrency 256]
+
+With --p99-budget (milliseconds), concurrency is stepped up until p99 latency goes
+over the budget, reporting the highest throughput that stayed within it.
+Every client thread keeps its connection open between requests.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection
+    from urllib.parse import urlparse
+except ImportError:  # python 2
+    from httplib import HTTPConnection, HTTPSConnection
+    from urlparse import urlparse
+
+import constants
+
+# (source, translation) templates per language pair; translations are valid
+SEGMENTS = {
+    "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH): (
+        u"'Hello world,' she said. ", u"«Bonjour tout le monde», dit-elle. "),
+    "{}_{}".format(constants.LC_ENGLISH, constants.LC_GERMAN): (
+        u"'Hello world,' she said. ", u"„Hallo Welt“, sagte sie. "),
+    "{}_{}".format(constants.LC_ENGLISH, constants.LC_JAPANESE): (
+        u"'Hello world,' she said. ", u"「世界こんにちは」と彼女は言いました。"),
+    "{}_{}".format(constants.LC_JAPANESE, constants.LC_ENGLISH): (
+        u"「これは最高なものです！」と、彼女は叫びました。", u"'This is the best!', she exclaimed. "),
+}
+
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+
+class SegmentMix(object):
+    """ Random segments following a mix of language pairs, sizes and invalid ratio
+
+    language_pairs is a dict of language pair to weight; sizes a list of
+    sentence repeats to pick from.
+    """
+
+    def __init__(self, language_pairs=None, sizes=(1, 1, 1, 4, 16), invalid_ratio=0.1, strict_ratio=0.5, seed=None):
+        self.language_pairs = language_pairs or dict((language_pair, 1) for language_pair in SEGMENTS)
+        self.sizes = sizes
+        self.invalid_ratio = invalid_ratio
+        self.strict_ratio = strict_ratio
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def segment(self):
+        """ Returns a request payload """
+        with self._lock:
+            total = sum(self.language_pairs.values())
+            pick = self.random.uniform(0, total)
+            for language_pair, weight in sorted(self.language_pairs.items()):
+                pick -= weight
+                if pick <= 0:
+                    break
+            size = self.random.choice(self.sizes)
+            invalid = self.random.random() < self.invalid_ratio
+            strict = self.random.random() < self.strict_ratio
+
+        source, translation = SEGMENTS[language_pair]
+        source, translation = source * size, translation * size
+        if invalid:
+            # drop the first quotation; leaves an orphan
+            translation = translation[1:]
+        return {"source": source, "translation": translation, "language_pair": language_pair, "strict": strict}
+
+
+def percentile(latencies, ratio):
+    """ Returns the latency under which ratio of the (sorted) latencies fall """
+    if not latencies:
+        return None
+    index = min(int(ratio * len(latencies)), len(latencies) - 1)
+    return latencies[index]
+
+
+def run(url, requests=1000, concurrency=8, mix=None, timeout=10):
+    """ Sends requests to the /validate endpoint of url and returns a report dict """
+    mix = mix or SegmentMix()
+    parsed = urlparse(url)
+    connection_class = HTTPSConnection if parsed.scheme == "https" else HTTPConnection
+    path = parsed.path.rstrip("/") + "/validate"
+    latencies = []
+    failures = [0]
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def client():
+        # kept alive between requests, so that latencies do not include connection setup
+        connection = connection_class(parsed.netloc, timeout=timeout)
+        try:
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        return
+                    remaining[0] -= 1
+
+                body = json.dumps(mix.segment()).encode('utf-8')
+                start = time.time()
+                try:
+                    connection.request("POST", path, body, {"Content-Type": "application/json"})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        raise IOError(response.status)
+                except Exception:
+                    connection.close()  # reconnects on the next request
+                    with lock:
+                        failures[0] += 1
+                    continue
+                latency = time.time() - start
+                with lock:
+                    latencies.append(latency)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    report = {
+        "requests": len(latencies),
+        "failures": failures[0],
+        "concurrency": concurrency,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+    }
+    for name, ratio in PERCENTILES:
+        report[name] = percentile(latencies, ratio)
+    return report
+
+
+def within_budget(report, p99_budget):
+    """ Returns True if a report has no failed request and its p99 latency (seconds) is within budget """
+    return not report["failures"] and report["p99"] is not None and report["p99"] <= p99_budget
+
+
+def find_capacity(url, p99_budget, requests=1000, max_concurrency=256, mix=None, timeout=10, on_step=None):
+    """ Returns (best report within budget or None, every report) for a p99 latency budget in seconds
+
+    Concurrency doubles from 1 until the budget is exceeded, then the gap between the last
+    concurrency within budget and the first over it is bisected. on_step(report) is called
+    after every run when given.
+    """
+    reports = []
+
+    def step(concurrency):
+        report = run(url, requests, concurrency, mix, timeout)
+        report["within_budget"] = within_budget(report, p99_budget)
+        reports.append(report)
+        if on_step is not None:
+            on_step(report)
+        return report["within_budget"]
+
+    good, bad = 0, None
+    concurrency = 1
+    while concurrency <= max_concurrency:
+        if not step(concurrency):
+            bad = concurrency
+            break
+        good = concurrency
+        concurrency *= 2
+
+    if bad is not None:
+        while bad - good > 1:
+            middle = (good + bad) // 2
+            if step(middle):
+                good = middle
+            else:
+                bad = middle
+
+    passing = [report for report in reports if report["within_budget"]]
+    best = max(passing, key=lambda report: report["throughput"]) if passing else None
+    return best, reports
+
+
+def regressions(report, baseline, tolerance=0.1):
+    """ Returns a list of messages for every metric worse than baseline by more than tolerance """
+    messages = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        messages.append(u"throughput {:.1f}/s is below baseline {:.1f}/s".format(
+            report["throughput"], baseline["throughput"]))
+    for name, _ in PERCENTILES:
+        if report.get(name) is not None and baseline.get(name) is not None and \
+                report[name] > baseline[name] * (1 + tolerance):
+            messages.append(u"{} {:.2f}ms is above baseline {:.2f}ms".format(
+                name, report[name] * 1000, baseline[name] * 1000))
+    if report["failures"] > baseline.get("failures", 0):
+        messages.append(u"{} failed requests, baseline had {}".format(report["failures"], baseline.get("failures", 0)))
+    return messages
+
+
+def _print_report(report):
+    print(u"{requests} requests ({failures} failed) at concurrency {concurrency}: {throughput:.1f} requests/s".format(
+        **report))
+    print(u"  ".join(u"{} {:.2f}ms".format(name, report[name] * 1000)
+                     for name, _ in PERCENTILES if report[name] is not None))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the quotations validation server")
+    parser.add_argument("url")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--invalid-ratio", type=float, default=0.1)
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the report to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--p99-budget", type=float, help="p99 latency budget in milliseconds; finds the "
+                                                         "highest throughput within it")
+    parser.add_argument("--max-concurrency", type=int, default=256)
+    arguments = parser.parse_args(argv)
+    mix = SegmentMix(invalid_ratio=arguments.invalid_ratio)
+
+    if arguments.p99_budget is not None:
+        def on_step(report):
+            _print_report(report)
+            print(u"  {} p99 budget of {:.2f}ms".format(
+                u"within" if report["within_budget"] else u"OVER", arguments.p99_budget))
+
+        best, _ = find_capacity(arguments.url, arguments.p99_budget / 1000.0, arguments.requests,
+                                arguments.max_concurrency, mix, on_step=on_step)
+        if best is None:
+            print(u"FAIL: p99 budget exceeded at every concurrency")
+            return 1
+        print(u"PASS: {throughput:.1f} requests/s at concurrency {concurrency} within the p99 budget".format(**best))
+        return 0
+
+    report = run(arguments.url, arguments.requests, arguments.concurrency, mix)
+    _print_report(report)
+
+    if arguments.baseline and arguments.save_baseline:
+        with open(arguments.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    elif arguments.baseline:
+        with open(arguments.baseline) as f:
+            messages = regressions(report, json.load(f), arguments.tolerance)
+        for message in messages:
+            print(u"REGRESSION: {}".format(message))
+        return 1 if messages else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,10 @@
 from __future__ import absolute_import
 
 import constants
+from compat import PY2
 from errors import (LanguageNotSupported,
                     QuotationNotFound)
-from utils import QUOTATION_MAP
+from utils import QUOTATION_MAP, confusable_table
 
 
 class Quotation(object):
@@ -18,10 +19,14 @@ class Quotation(object):
         self._closing = position % 2 == 1  # opening or closing quotation based on position
 
     @classmethod
-    def create(cls, lc, char, force_close=False):
+    def create(cls, lc, char, force_close=False, normalize=False):
         if lc not in QUOTATION_MAP:
             raise LanguageNotSupported(u"[{}] language code is not supported".format(lc))
 
+        if normalize:
+            # lookalikes such as full-width quotations stand for their canonical quotation
+            char = char.translate(confusable_table(lc))
+
         try:
             position = QUOTATION_MAP[lc].index(char)
             is_closed = position % 2 == 1
@@ -53,8 +58,20 @@ class Quotation(object):
                self._closing is not other._closing and \
                abs(self._position - other._position) == 1
 
-    def __str__(self):
-        return QUOTATION_MAP[self._lc][self._position].encode('utf-8')
+    @property
+    def char(self):
+        """ The quotation character, as unicode """
+        return QUOTATION_MAP[self._lc][self._position]
+
+    if PY2:
+        def __str__(self):
+            return self.char.encode('utf-8')
+
+        def __unicode__(self):
+            return self.char
+    else:
+        def __str__(self):
+            return self.char
 
     def __repr__(self):
         return str(self)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from errors import LanguageNotSupported
+from libs import QuotationHandler, is_word_character, pair_quotations, scan_quotations
+from utils import NEUTRAL_EXCLUDE, NEUTRAL_QUOTATIONS, QUOTATION_MAP, quotation_table
+
+
+class _Events(QuotationHandler):
+    """ Records the quotations and lone rangers of a text, in order """
+
+    def __init__(self):
+        self.events = []  # (index, char, True if a quotation, False if a lone ranger)
+        self.positions = []  # QUOTATION_MAP positions of quotations
+
+    def quotation(self, index, char, position):
+        self.events.append((index, char, True))
+        self.positions.append(position)
+
+    open = close = quotation
+
+    def lone_ranger(self, index, char):
+        self.events.append((index, char, False))
+
+
+class QuotationNormalizer(object):
+    """ Rewrites neutral quotations of a text into the preferred quotations of a language
+
+    Works on the quotations found by scan_quotations, with the same open/close
+    toggling as the validator: a neutral quotation and the same neutral quotation
+    closing it are rewritten into the first pair of QUOTATION_MAP[lc]. A closing
+    neutral quotation right after a word (a lone ranger to the extractor) is
+    rewritten too, unless it is an apostrophe, e.g. l'homme.
+    The validator reads quotations inside quotations as closing ones, so nested
+    quotations are left untouched, as are orphans.
+    """
+
+    def __init__(self, lc):
+        if lc not in QUOTATION_MAP:
+            raise LanguageNotSupported(u"[{}] language code is not supported".format(lc))
+
+        self.lc = lc
+        quotations = QUOTATION_MAP[lc]
+        self.opening, self.closing = quotations[0], quotations[1]
+        self._neutral = frozenset(NEUTRAL_QUOTATIONS)
+
+    def normalize(self, text):
+        """ Returns (normalized text, edits)
+
+        edits is a list of (index, original quotation, new quotation), in order of index.
+        Edits are only made when the normalized text validates; otherwise (e.g. a
+        text with an orphan) text is returned unchanged, so valid texts stay valid.
+        """
+        if self.lc in NEUTRAL_EXCLUDE:
+            return text, []
+
+        handler = _Events()
+        scan_quotations(text, self.lc, handler)
+        if not handler.events:
+            return text, []
+
+        table = quotation_table(self.lc)
+        neutral = self._neutral
+        edits = []
+        positions = []  # positions of the quotations of the normalized text, as the validator will see them
+        pending = None  # (index, char) of the opening quotation waiting for the next one
+
+        for index, char, is_quotation in handler.events:
+            if not is_quotation and (pending is None or pending[1] != char or self._is_apostrophe(text, index)):
+                continue  # stays a lone ranger
+
+            if pending is None:
+                pending = (index, char)
+                positions.append(table[char])
+                continue
+
+            opening_index, opening_char = pending
+            pending = None
+            if opening_char == char and char in neutral:
+                edits.append((opening_index, char, self.opening))
+                edits.append((index, char, self.closing))
+                positions[-1] = table[self.opening]
+                positions.append(table[self.closing])
+            else:
+                position = table[char]
+                positions.append(position if position % 2 else position + 1)  # forced from open to close
+
+        if not edits:
+            return text, []
+
+        if pair_quotations(positions, len(positions), [0] * len(positions)):
+            return text, []  # some quotations would still be unmatched
+
+        output = []
+        start = 0
+        for index, _, replacement in edits:
+            output.append(text[start:index])
+            output.append(replacement)
+            start = index + 1
+        output.append(text[start:])
+        return u"".join(output), edits
+
+    @staticmethod
+    def _is_apostrophe(text, index):
+        """ True if the lone ranger at index (so right after a word character) is followed by one, e.g. l'homme """
+        return index + 1 < len(text) and is_word_character(text[index + 1])
@@ -6,8 +6,18 @@ from errors import (LanguageNotSupported,
                     QuotationValidationError,
                     TranslatedQuotationAmountDifference,
                     TranslatedQuotationWrongOrder)
-from libs import QuotationExtractor
-from utils import QUOTATION_MAP
+from libs import (QuotationExtractor, QuotationPrefilter, has_quotations, is_word_character, pair_quotations,
+                  quotation_spans, record_quotations)
+from models import Quotation
+from utils import (LONE_RANGERS, QUOTATION_MAP, confusable_table, quotation_pattern, quotation_table,
+                   split_language_pair)
+
+_local = None  # threading.local() of validate_targets, created on first use
+
+
+def _format_quotations(quotations):
+    """ Returns quotations as a unicode list, e.g. [«, »] """
+    return u"[{}]".format(u", ".join(quotation.char for quotation in quotations))
 
 
 class QuotationValidator(object):
@@ -17,7 +27,8 @@ class QuotationValidator(object):
 
     @staticmethod
     def validate_open_close(text, lc):
-        """
+        """ Returns the QuotationSpans (see libs.quotation_spans) of the matched quotations of text
+
         Raises:
             QuotationMissingPair if orphaned quotations found
             LanguageNotSupported if lc is not supported
@@ -25,17 +36,12 @@ class QuotationValidator(object):
         if lc not in QUOTATION_MAP:
             raise LanguageNotSupported
 
-        stack = []
-        for index, quotation in enumerate(QuotationExtractor(text, lc).extract()):
-            if len(stack) and stack[-1] ^ quotation:
-                # found complement
-                stack.pop()
-            else:
-                stack.append(quotation)
-
-        if stack:
-            # not empty; extra quotations not closed
-            raise QuotationMissingPair(u"there are orphaned quotations: {}".format(stack))
+        spans = quotation_spans(text, lc)
+        if len(spans.unmatched):
+            # extra quotations not closed
+            stack = [Quotation(lc, position) for position in spans.unmatched_positions]
+            raise QuotationMissingPair(u"there are orphaned quotations: {}".format(_format_quotations(stack)))
+        return spans
 
     @staticmethod
     def validate_translated_quotations(source, translation, source_lc, translation_lc):
@@ -46,7 +52,7 @@ class QuotationValidator(object):
         if len(source_extractor) != len(translation_extractor):
             raise TranslatedQuotationAmountDifference(
                 u"total quotations of source ({}) and translation ({}) is different.".format(
-                    list(source_extractor.extract()), list(translation_extractor.extract())
+                    _format_quotations(source_extractor.extract()), _format_quotations(translation_extractor.extract())
                 )
             )
 
@@ -54,28 +60,36 @@ class QuotationValidator(object):
         source_quotations = list(source_extractor.extract())
         translation_quotations = list(translation_extractor.extract())
 
-        for index in xrange(len(source_quotations)):
+        for index in range(len(source_quotations)):
             if source_quotations[index] == translation_quotations[index]:
                 continue
             else:
                 raise TranslatedQuotationWrongOrder(
-                    "differing order in quotation: source ({}), target ({})".format(
-                        source_quotations[index],
-                        translation_quotations[index]
+                    u"differing order in quotation: source ({}), target ({})".format(
+                        source_quotations[index].char,
+                        translation_quotations[index].char
                     )
                 )
 
     @staticmethod
-    def validate(source, translation, language_pair, verbose=False, strict=False):
+    def validate(source, translation, language_pair, verbose=False, strict=False, normalize=False):
         """ Returns true if validations passed, else False
 
         If verbose is True, returns a tuple of (bool, validation_error)
         If strict is True, validation is done across source and translation
+        If normalize is True, lookalikes of quotations (e.g. full-width ones) count as quotations
         """
         try:
-            source_lc, translation_lc = language_pair.split("_", 2)
-            if source_lc not in QUOTATION_MAP or translation_lc not in QUOTATION_MAP:
-                raise LanguageNotSupported
+            source_lc, translation_lc = split_language_pair(language_pair)
+            if normalize:
+                # one to one character mapping; offsets are kept
+                source = source.translate(confusable_table(source_lc))
+                translation = translation.translate(confusable_table(translation_lc))
+            if not has_quotations(translation, translation_lc) and \
+                    not (strict and has_quotations(source, source_lc)):
+                # nothing to validate
+                return True if not verbose else (True, "")
+
             # validate opening and closing quotations only for translation
             QuotationValidator.validate_open_close(translation, translation_lc)
         except QuotationValidationError as e:
@@ -96,3 +110,336 @@ class QuotationValidator(object):
                         return False
 
         return True if not verbose else (True, "")
+
+    @staticmethod
+    def validate_batch(segments, language_pair, verbose=False, strict=False, normalize=False):
+        """ Yields the validate result of every (source, translation) in segments
+
+        Results are produced as segments are consumed, in order.
+        """
+        try:
+            validator = LanguagePairValidator(language_pair, strict=strict, normalize=normalize)
+        except QuotationValidationError:
+            validator = None
+
+        if validator is not None:
+            for result in validator.validate_many(segments, verbose=verbose):
+                yield result
+            return
+
+        for source, translation in segments:
+            yield QuotationValidator.validate(source, translation, language_pair, verbose=verbose, strict=strict,
+                                              normalize=normalize)
+
+    @staticmethod
+    def validate_targets(source, source_lc, translations, verbose=False, strict=False, pool=None):
+        """ Returns a dict of target language code to validate result of every translation of a source
+
+        translations is a dict (or iterable of pairs) of target language code to translation.
+        Source quotations are extracted once for all targets.
+        If pool is given (e.g. a multiprocessing.Pool), targets are validated through its map.
+        """
+        if hasattr(translations, "items"):
+            translations = translations.items()
+
+        source_quotations = None
+        if strict and source_lc in QUOTATION_MAP:
+            source_quotations = LanguagePairValidator.extract_quotations(source, source_lc)
+
+        tasks = [(source, source_lc, lc, translation, source_quotations, verbose, strict)
+                 for lc, translation in translations]
+        results = (pool.map if pool is not None else map)(_validate_target, tasks)
+        return dict((task[2], result) for task, result in zip(tasks, results))
+
+
+def _validate_target(task):
+    """ Validates one target of QuotationValidator.validate_targets """
+    source, source_lc, lc, translation, source_quotations, verbose, strict = task
+    language_pair = u"{}_{}".format(source_lc, lc)
+    if source_lc not in QUOTATION_MAP or lc not in QUOTATION_MAP:
+        return QuotationValidator.validate(source, translation, language_pair, verbose=verbose, strict=strict)
+
+    return _target_validator(language_pair).validate(source, translation, verbose=verbose, strict=strict,
+                                                      source_quotations=source_quotations)
+
+
+def _target_validator(language_pair):
+    """ Returns the LanguagePairValidator of a supported language pair, one per thread and pair
+
+    threading is only imported once targets are first validated, keeping it off the import path.
+    """
+    global _local
+    if _local is None:
+        import threading
+
+        _local = threading.local()
+
+    validators = getattr(_local, 'validators', None)
+    if validators is None:
+        validators = _local.validators = {}
+
+    validator = validators.get(language_pair)
+    if validator is None:
+        validator = validators[language_pair] = LanguagePairValidator(language_pair)
+    return validator
+
+
+class LanguagePairValidator(object):
+    """ Reusable validator bound to a single language pair
+
+    Keeps its own scratch buffers (quotation arrays and a stack) sized to the
+    largest segment seen so far, so validating a segment that passes does not
+    build Quotation instances, lists or extractors. The scan still creates a
+    regular expression match object per quotation found; segments without
+    quotations are accepted by the prefilter before any scan.
+    Failing segments are re-run through QuotationValidator.validate to build
+    the very same errors.
+
+    Instances are not meant to be shared; create one per thread.
+    """
+
+    def __init__(self, language_pair, strict=False, normalize=False):
+        source_lc, translation_lc = split_language_pair(language_pair)
+
+        self.language_pair = language_pair
+        self.source_lc = source_lc
+        self.translation_lc = translation_lc
+        self.strict = strict
+        self.normalize = normalize
+        if normalize:
+            self._source_confusables = confusable_table(source_lc)
+            self._translation_confusables = confusable_table(translation_lc)
+
+        self.prefilter = QuotationPrefilter(source_lc, translation_lc)
+
+        self._capacity = 0
+        self._stack = []
+        self._source_positions = []
+        self._translation_positions = []
+
+    def _reserve(self, size):
+        """ Grows scratch buffers so that they can hold quotations for a text of given size """
+        if size > self._capacity:
+            extra = [0] * (size - self._capacity)
+            self._stack.extend(extra)
+            self._source_positions.extend(extra)
+            self._translation_positions.extend(extra)
+            self._capacity = size
+
+    @staticmethod
+    def _scan(text, lc, positions):
+        """ Stores QUOTATION_MAP positions of quotations found in text into positions
+
+        Mirrors QuotationExtractor.extract; returns the amount of quotations found.
+        Allocates a match object per quotation, nothing per other character.
+        """
+        table = quotation_table(lc)
+        count = 0
+        closed = True
+        for match in quotation_pattern(lc).finditer(text):
+            index = match.start()
+            char = text[index]
+            if index and char in LONE_RANGERS and is_word_character(text[index - 1]):
+                # lone ranger; not a true quotation
+                continue
+
+            position = table[char]
+            closed = not closed
+            if closed and position % 2 == 0:
+                position += 1  # forced from open to close
+            positions[count] = position
+            count += 1
+        return count
+
+    @classmethod
+    def extract_quotations(cls, text, lc):
+        """ Returns a tuple of the closing flags of quotations found in text
+
+        Can be passed to validate as source_quotations to skip extracting the same source again.
+        """
+        positions = [0] * len(text)
+        count = cls._scan(text, lc, positions)
+        return tuple(position % 2 == 1 for position in positions[:count])
+
+    def _is_valid(self, source, translation, strict, source_quotations=None):
+        self._reserve(max(len(source) if strict and source_quotations is None else 0, len(translation)))
+
+        positions = self._translation_positions
+        count = self._scan(translation, self.translation_lc, positions)
+
+        if pair_quotations(positions, count, self._stack):
+            return False
+
+        if strict and source_quotations is not None:
+            if len(source_quotations) != count:
+                return False
+
+            index = 0
+            while index < count:
+                if source_quotations[index] != (positions[index] % 2 == 1):
+                    return False
+                index += 1
+
+        elif strict:
+            source_positions = self._source_positions
+            if self._scan(source, self.source_lc, source_positions) != count:
+                return False
+
+            index = 0
+            while index < count:
+                if source_positions[index] % 2 != positions[index] % 2:
+                    return False
+                index += 1
+
+        return True
+
+    def validate(self, source, translation, verbose=False, strict=None, source_quotations=None):
+        """ Returns true if validations passed, else False
+
+        Same as QuotationValidator.validate, for the bound language pair.
+        strict defaults to the value given when creating the validator.
+        source_quotations may be given from extract_quotations(source, source_lc).
+        """
+        if strict is None:
+            strict = self.strict
+
+        if self.normalize:
+            source = source.translate(self._source_confusables)
+            translation = translation.translate(self._translation_confusables)
+
+        if strict and source_quotations is not None:
+            # the source was scanned already; a translation without quotations only passes with it
+            accepted = not source_quotations and self.prefilter.accepts(translation)
+        else:
+            accepted = self.prefilter.accepts(translation, source if strict else None)
+
+        if accepted or self._is_valid(source, translation, strict, source_quotations):
+            return True if not verbose else (True, "")
+
+        return QuotationValidator.validate(source, translation, self.language_pair, verbose=verbose, strict=strict)
+
+    def validate_many(self, segments, verbose=False, chunk=64):
+        """ Yields the validate result of every (source, translation) in segments
+
+        Segments are checked against the prefilter a chunk at a time; chunks free of
+        quotations are accepted without looking at each segment.
+        """
+        ok = True if not verbose else (True, "")
+        buffered = []
+        for segment in segments:
+            buffered.append(segment)
+            if len(buffered) == chunk:
+                for result in self._validate_chunk(buffered, verbose, ok):
+                    yield result
+                buffered = []
+
+        for result in self._validate_chunk(buffered, verbose, ok):
+            yield result
+
+    def _validate_chunk(self, segments, verbose, ok):
+        if not segments:
+            return
+        if len(segments) == 1:
+            # validate runs the prefilter on its own; checking here too would count the segment twice
+            yield self.validate(segments[0][0], segments[0][1], verbose=verbose)
+            return
+
+        translations = u"\0".join(translation for _, translation in segments)
+        sources = u"\0".join(source for source, _ in segments) if self.strict else None
+        if self.normalize:
+            # lookalikes of either language stand for quotations; tables never map a quotation itself
+            translations = translations.translate(self._translation_confusables).translate(self._source_confusables)
+            if sources is not None:
+                sources = sources.translate(self._source_confusables).translate(self._translation_confusables)
+
+        if self.prefilter.accepts(translations, sources, segments=len(segments)):
+            for _ in segments:
+                yield ok
+            return
+
+        for source, translation in segments:
+            yield self.validate(source, translation, verbose=verbose)
+
+
+class DocumentValidator(object):
+    """ Validates quotations across the consecutive segments of a document (subtitle cues, split paragraphs)
+
+    Segments are fed in order and checked as if they were one text, so a quotation
+    may open in one segment and close several segments later. Only quotations still
+    open are kept, never the segments themselves.
+    """
+
+    def __init__(self, lc, normalize=False):
+        if lc not in QUOTATION_MAP:
+            raise LanguageNotSupported(u"[{}] language code is not supported".format(lc))
+
+        self.lc = lc
+        self.normalize = normalize
+        self.reset()
+
+    def reset(self):
+        """ Starts a new document """
+        # quotations left unmatched so far, bottom of the stack first
+        self._positions = []
+        self._segments = []
+        self._offsets = []
+        self._closed = True
+        self.first_segment = self.last_segment = None
+
+    def feed(self, segment, text):
+        """ Scans the quotations of the next segment of the document; segment identifies it in errors """
+        if self.first_segment is None:
+            self.first_segment = segment
+        self.last_segment = segment
+
+        offsets, positions = record_quotations(text, self.lc, normalize=self.normalize, closed=self._closed)
+        if len(positions) % 2:
+            self._closed = not self._closed
+
+        # carry on with the stack left by the previous segments
+        carried = len(self._positions)
+        positions = self._positions + positions
+        stack = [0] * len(positions)
+        top = pair_quotations(positions, len(positions), stack)
+
+        segments = self._segments
+        carried_offsets = self._offsets
+        self._positions = [positions[index] for index in stack[:top]]
+        self._segments = [segments[index] if index < carried else segment for index in stack[:top]]
+        self._offsets = [carried_offsets[index] if index < carried else offsets[index - carried]
+                         for index in stack[:top]]
+
+    def unmatched(self):
+        """ Returns (segment, index, quotation, start segment, end segment) of quotations without a complement
+
+        Opening quotations are left open from their segment to the last one; closing
+        quotations close nothing from the first segment to their own.
+        """
+        quotations = QUOTATION_MAP[self.lc]
+        return [(segment, index, quotations[position],
+                 segment if position % 2 == 0 else self.first_segment,
+                 self.last_segment if position % 2 == 0 else segment)
+                for position, segment, index in zip(self._positions, self._segments, self._offsets)]
+
+    def close(self, verbose=False):
+        """ Returns true if every quotation of the document found its complement, else False
+
+        The validator is reset for the next document. If verbose, returns (ok, error) as
+        QuotationValidator.validate does, the error naming the segments of the orphaned quotations.
+        """
+        unmatched = self.unmatched()
+        self.reset()
+        if not unmatched:
+            return True if not verbose else (True, "")
+        if not verbose:
+            return False
+
+        orphans = u", ".join(u"{} in {} (from {} to {})".format(quotation, segment, start, end)
+                             for segment, _, quotation, start, end in unmatched)
+        return False, QuotationMissingPair(u"there are orphaned quotations: [{}]".format(orphans))
+
+    def validate(self, segments, verbose=False):
+        """ Returns the close result of a whole document of (segment, text) """
+        for segment, text in segments:
+            self.feed(segment, text)
+        return self.close(verbose=verbose)
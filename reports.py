@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import heapq
+
+
+class ValidationReport(object):
+    """ Streaming accumulator of validation results
+
+    Keeps counters per language pair and per error class, plus a bounded heap
+    of the worst files. Results of a file are expected to arrive together;
+    a file is ranked once results for another file start coming in.
+    Reports built by separate workers can be combined with merge; a file split
+    across workers is recognised as long as its parts rank within the top files.
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.total = 0
+        self.failed = 0
+        self.files = 0
+        self.language_pairs = {}  # language pair -> [total, failed]
+        self.errors = {}  # error class name -> failed
+
+        self._worst = []  # min heap of (failed, total, filename), at most top long
+        self._file = None
+        self._file_total = 0
+        self._file_failed = 0
+
+    def add(self, result, language_pair, filename=None):
+        """ Accumulates a single QuotationValidator.validate result (verbose or not) """
+        if isinstance(result, tuple):
+            ok, error = result
+        else:
+            ok, error = result, None
+
+        if filename != self._file:
+            self._rank_file()
+            self._file = filename
+            if filename is not None:
+                self.files += 1
+
+        counts = self.language_pairs.setdefault(language_pair, [0, 0])
+        counts[0] += 1
+        self.total += 1
+        self._file_total += 1
+
+        if not ok:
+            counts[1] += 1
+            self.failed += 1
+            self._file_failed += 1
+            error_name = type(error).__name__ if error else "QuotationValidationError"
+            self.errors[error_name] = self.errors.get(error_name, 0) + 1
+
+    def consume(self, results, language_pair, filename=None):
+        """ Accumulates every result of an iterable, e.g. QuotationValidator.validate_batch
+
+        Yields the results back so that reporting can sit in the middle of a pipeline.
+        """
+        for result in results:
+            self.add(result, language_pair, filename=filename)
+            yield result
+
+    def _push(self, worst, entry):
+        if len(worst) < self.top:
+            heapq.heappush(worst, entry)
+        elif entry > worst[0]:
+            heapq.heapreplace(worst, entry)
+
+    def _rank_file(self):
+        if self._file is not None:
+            self._push(self._worst, (self._file_failed, self._file_total, self._file))
+        self._file = None
+        self._file_total = self._file_failed = 0
+
+    def worst_files(self):
+        """ Returns a list of (filename, total, failed), most failures first """
+        return [(filename, total, failed) for filename, total, failed in self._ranked() if failed]
+
+    def _ranked(self):
+        worst = list(self._worst)
+        if self._file is not None:
+            self._push(worst, (self._file_failed, self._file_total, self._file))
+        return [(filename, total, failed) for failed, total, filename in sorted(worst, reverse=True)]
+
+    def error_rate(self, language_pair=None):
+        """ Returns the ratio of failed results, overall or for a language pair """
+        total, failed = self.language_pairs.get(language_pair, [0, 0]) if language_pair else (self.total, self.failed)
+        return float(failed) / total if total else 0.0
+
+    def merge(self, other):
+        """ Adds the counts of another report into this one """
+        # a file split across workers is ranked by its combined counts
+        ranked = self._ranked()
+        other_ranked = other._ranked()
+        files = {}
+        for filename, total, failed in ranked + other_ranked:
+            counts = files.setdefault(filename, [0, 0])
+            counts[0] += total
+            counts[1] += failed
+
+        self.total += other.total
+        self.failed += other.failed
+        self.files += other.files - (len(ranked) + len(other_ranked) - len(files))
+        for language_pair, (total, failed) in other.language_pairs.items():
+            counts = self.language_pairs.setdefault(language_pair, [0, 0])
+            counts[0] += total
+            counts[1] += failed
+        for error_name, failed in other.errors.items():
+            self.errors[error_name] = self.errors.get(error_name, 0) + failed
+
+        self._file = None
+        self._file_total = self._file_failed = 0
+        self._worst = []
+        for filename, (total, failed) in files.items():
+            self._push(self._worst, (failed, total, filename))
+        return self
+
+    def to_dict(self):
+        return {
+            "top": self.top,
+            "total": self.total,
+            "failed": self.failed,
+            "files": self.files,
+            "language_pairs": dict((k, list(v)) for k, v in self.language_pairs.items()),
+            "errors": dict(self.errors),
+            "worst_files": [[filename, total, failed] for failed, total, filename in sorted(self._worst, reverse=True)],
+            "file": [self._file, self._file_total, self._file_failed],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls(top=data["top"])
+        report.total = data["total"]
+        report.failed = data["failed"]
+        report.files = data["files"]
+        report.language_pairs = dict((k, list(v)) for k, v in data["language_pairs"].items())
+        report.errors = dict(data["errors"])
+        for filename, total, failed in data["worst_files"]:
+            report._push(report._worst, (failed, total, filename))
+        report._file, report._file_total, report._file_failed = data["file"]
+        return report
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+""" Checkpointed validation of large corpora
+
+A corpus is a newline delimited JSON file with one segment per line:
+
+    {"source": "...", "translation": "...", "language_pair": "en_fr", "file": "..."}
+
+language_pair and file are optional.
+"""
+from __future__ import absolute_import
+
+import collections
+import json
+import os
+
+from errors import LanguageNotSupported, QuotationValidationError
+from quotations import LanguagePairValidator
+from reports import ValidationReport
+from utils import split_language_pair
+
+
+def iter_records(fileobj, start=0, end=None):
+    """ Yields (offset, record) of every segment of a corpus between start and end byte offsets
+
+    start must be the offset of a line; offset is where the line after the record starts.
+    """
+    fileobj.seek(start)
+    offset = start
+    while end is None or offset < end:
+        line = fileobj.readline()
+        if not line:
+            break
+        offset += len(line)
+        line = line.strip()
+        if line:
+            yield offset, json.loads(line.decode('utf-8'))
+
+
+class SegmentValidator(object):
+    """ Validates corpus records, reusing a LanguagePairValidator per language pair
+
+    At most max_validators validators are kept, the oldest being dropped first.
+    """
+
+    def __init__(self, language_pair=None, strict=False, max_validators=32):
+        self.language_pair = language_pair
+        self.strict = strict
+        self.max_validators = max_validators
+        self._validators = collections.OrderedDict()  # (source lc, translation lc) -> LanguagePairValidator
+
+    def validate(self, record):
+        """ Returns (language_pair, verbose validation result) of a corpus record """
+        language_pair = record.get("language_pair", self.language_pair)
+        source = record.get("source", u"")
+        translation = record["translation"]
+        if not language_pair:
+            return language_pair, (False, LanguageNotSupported(u"no language pair given"))
+
+        try:
+            key = split_language_pair(language_pair)
+        except QuotationValidationError as e:
+            return language_pair, (False, e)
+
+        validator = self._validators.get(key)
+        if validator is None:
+            if len(self._validators) >= self.max_validators:
+                self._validators.popitem(last=False)
+            validator = self._validators[key] = LanguagePairValidator(language_pair, strict=self.strict)
+        return language_pair, validator.validate(source, translation, verbose=True)
+
+    def run(self, records, report):
+        """ Validates (offset, record) pairs into report; yields offsets back as records are done """
+        for offset, record in records:
+            language_pair, result = self.validate(record)
+            report.add(result, language_pair, filename=record.get("file"))
+            yield offset
+
+
+def validate_ndjson(lines, language_pair=None, strict=False, on_result=None):
+    """ Yields a JSON result line for every newline delimited JSON segment of lines
+
+    Result lines look like {"index": 0, "ok": false, "error": {"type": ..., "message": ...}}.
+    Lines that are not segments (bad JSON, no translation) get a ValueError result and the
+    stream carries on. Lines are consumed and results produced one at a time;
+    on_result(language_pair, result) is called for every result when given.
+    """
+    validator = SegmentValidator(language_pair, strict=strict)
+    index = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            segment_language_pair, (ok, error) = validator.validate(json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            segment_language_pair, ok = None, False
+            error = ValueError(u"invalid segment ({}: {})".format(type(e).__name__, e))
+        if on_result is not None:
+            on_result(segment_language_pair, (ok, error))
+
+        result = {"index": index, "ok": ok, "error": None}
+        if not ok:
+            message = error.args[0] if error.args else u""
+            if isinstance(message, bytes):
+                message = message.decode('utf-8')
+            result["error"] = {"type": type(error).__name__, "message": message}
+        yield json.dumps(result) + "\n"
+        index += 1
+
+
+class CorpusRunner(object):
+    """ Validates a corpus, saving a checkpoint every checkpoint_every segments
+
+    Running again with the same checkpoint path resumes from the last checkpoint,
+    producing the same report as an uninterrupted run.
+    """
+
+    def __init__(self, path, checkpoint_path, language_pair=None, strict=False, checkpoint_every=10000, top=10):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.strict = strict
+        self.top = top
+        self.validator = SegmentValidator(language_pair, strict=strict)
+
+    def load_checkpoint(self):
+        """ Returns (offset, report) saved by the last checkpoint, or a fresh start """
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint["path"] == os.path.abspath(self.path) and checkpoint["strict"] == self.strict:
+                return checkpoint["offset"], ValidationReport.from_dict(checkpoint["report"])
+        return 0, ValidationReport(top=self.top)
+
+    def save_checkpoint(self, offset, report):
+        """ Atomically replaces the checkpoint file """
+        checkpoint = {
+            "path": os.path.abspath(self.path),
+            "strict": self.strict,
+            "offset": offset,
+            "report": report.to_dict(),
+        }
+        tmp_path = "{}.tmp".format(self.checkpoint_path)
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.checkpoint_path)
+
+    def run(self):
+        """ Returns the ValidationReport of the whole corpus """
+        offset, report = self.load_checkpoint()
+        with open(self.path, "rb") as f:
+            done = 0
+            for offset in self.validator.run(iter_records(f, offset), report):
+                done += 1
+                if done % self.checkpoint_every == 0:
+                    self.save_checkpoint(offset, report)
+
+        self.save_checkpoint(offset, report)
+        return report
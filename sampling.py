@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+""" Estimates of quotation error rates from a sample of a corpus
+
+Records (see runner) are streamed once; a sample of sample_size records is
+kept across all strata (file and language pair), allocated in proportion to
+their sizes, and only sampled records are validated.
+"""
+from __future__ import absolute_import, division
+
+import heapq
+import math
+import random
+
+from runner import SegmentValidator, iter_records
+
+# two sided z scores of supported confidence levels
+Z_SCORES = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600, 0.98: 2.3263, 0.99: 2.5758}
+
+
+class _Stratum(object):
+
+    __slots__ = ('seen', 'first', 'sample', 'failed', 'errors')
+
+    def __init__(self):
+        self.seen = 0
+        self.first = None  # (priority, serial, record) of the lowest priority record
+        self.sample = []
+        self.failed = 0
+        self.errors = {}
+
+
+class SampledValidation(object):
+    """ Stratified priority sampling of a stream of corpus records
+
+    Every record gets a random priority; the sample_size records of lowest
+    priority across all strata are kept, so strata get shares of the sample in
+    proportion to their sizes. The lowest priority record of every stratum is
+    kept as well, so that small strata are never left out; at most sample_size
+    plus one record per stratum are held. Within a stratum the sample is the
+    records of lowest priority, a simple random sample. With stratify=False
+    the whole stream is a single stratum.
+    """
+
+    def __init__(self, sample_size=200, stratify=True, language_pair=None, strict=False, seed=None):
+        self.sample_size = sample_size
+        self.stratify = stratify
+        self.validator = SegmentValidator(language_pair, strict=strict)
+        self.random = random.Random(seed)
+        self.strata = {}
+        self._pool = []  # max heap of (-priority, serial, stratum, record) of the lowest priorities
+        self._serial = 0
+
+    def add(self, record):
+        """ Offers a record to the sample """
+        key = (record.get("file"), record.get("language_pair", self.validator.language_pair)) if self.stratify else None
+        stratum = self.strata.get(key)
+        if stratum is None:
+            stratum = self.strata[key] = _Stratum()
+
+        stratum.seen += 1
+        self._serial += 1
+        priority = self.random.random()
+        if stratum.first is None or priority < stratum.first[0]:
+            stratum.first = (priority, self._serial, record)
+
+        entry = (-priority, self._serial, stratum, record)
+        if len(self._pool) < self.sample_size:
+            heapq.heappush(self._pool, entry)
+        elif self._pool and priority < -self._pool[0][0]:
+            heapq.heapreplace(self._pool, entry)
+
+    def _draw(self):
+        """ Sets the sample of every stratum from the pool and the lowest priority records """
+        for stratum in self.strata.values():
+            stratum.sample = []
+        pooled = set()
+        for _, serial, stratum, record in self._pool:
+            stratum.sample.append(record)
+            pooled.add(serial)
+        for stratum in self.strata.values():
+            if stratum.first[1] not in pooled:
+                stratum.sample.append(stratum.first[2])
+
+    def consume(self, records):
+        for record in records:
+            self.add(record)
+        return self
+
+    def estimate(self, confidence=0.95):
+        """ Validates the samples and returns estimated error rates with confidence intervals
+
+        Returns a dict of population and sample sizes, "error_rate" and "errors" (per
+        error class name), rates being (estimate, low, high) tuples.
+        """
+        z = Z_SCORES[confidence]
+        population = sum(stratum.seen for stratum in self.strata.values())
+
+        self._draw()
+        for stratum in self.strata.values():
+            stratum.failed = 0
+            stratum.errors = {}
+            for record in stratum.sample:
+                _, (ok, error) = self.validator.validate(record)
+                if not ok:
+                    stratum.failed += 1
+                    error_name = type(error).__name__
+                    stratum.errors[error_name] = stratum.errors.get(error_name, 0) + 1
+
+        error_names = set()
+        for stratum in self.strata.values():
+            error_names.update(stratum.errors)
+
+        return {
+            "population": population,
+            "sampled": sum(len(stratum.sample) for stratum in self.strata.values()),
+            "strata": len(self.strata),
+            "error_rate": self._interval(population, z, lambda stratum: stratum.failed),
+            "errors": dict((error_name, self._interval(population, z, lambda stratum: stratum.errors.get(error_name, 0)))
+                           for error_name in sorted(error_names)),
+        }
+
+    def _interval(self, population, z, failures):
+        """ Returns (estimate, low, high) of a stratified proportion
+
+        Each stratum gets a Wilson score interval, with finite population correction,
+        so strata with no (or only) failures or a single sampled record still carry
+        their uncertainty. Stratum intervals are combined by the square and add
+        (MOVER) method for weighted sums.
+        """
+        if not population:
+            return 0.0, 0.0, 0.0
+
+        estimate = below = above = 0.0
+        for stratum in self.strata.values():
+            sampled = len(stratum.sample)
+            weight = stratum.seen / population
+            rate = failures(stratum) / sampled
+            low, high = _wilson(rate, sampled, stratum.seen, z)
+            estimate += weight * rate
+            below += (weight * (rate - low)) ** 2
+            above += (weight * (high - rate)) ** 2
+
+        return estimate, max(0.0, estimate - math.sqrt(below)), min(1.0, estimate + math.sqrt(above))
+
+
+def _wilson(rate, sampled, seen, z):
+    """ Returns the (low, high) Wilson score interval of a proportion sampled out of seen records """
+    if sampled >= seen:
+        return rate, rate  # every record was validated
+    # finite population correction, applied to the variance as a smaller z
+    z2 = z * z * (seen - sampled) / (seen - 1)
+    center = (rate + z2 / (2 * sampled)) / (1 + z2 / sampled)
+    margin = math.sqrt(z2) / (1 + z2 / sampled) * math.sqrt(rate * (1 - rate) / sampled + z2 / (4 * sampled ** 2))
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def sample_corpus(path, sample_size=200, stratify=True, language_pair=None, strict=False, seed=None,
+                  confidence=0.95):
+    """ Returns the estimate of a corpus file, read in a single pass """
+    sampling = SampledValidation(sample_size, stratify=stratify, language_pair=language_pair, strict=strict,
+                                 seed=seed)
+    with open(path, "rb") as f:
+        sampling.consume(record for _, record in iter_records(f))
+    return sampling.estimate(confidence)
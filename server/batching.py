@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import threading
+
+from quotations import QuotationValidator
+
+
+class _Request(object):
+
+    __slots__ = ('segment', 'result', 'error', 'done')
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Group(object):
+
+    __slots__ = ('requests', 'full')
+
+    def __init__(self):
+        self.requests = []
+        self.full = threading.Event()
+
+
+class MicroBatcher(object):
+    """ Coalesces concurrent single segment validations into batch runs
+
+    The first request of a language pair waits up to `window` seconds (or until
+    max_batch requests joined) and then validates the whole group with
+    QuotationValidator.validate_batch, handing results back to every waiting request.
+    A request arriving while no other one is in flight is validated at once, so
+    a lone client never waits for the window.
+    """
+
+    def __init__(self, window=0.002, max_batch=256):
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.segments = 0
+        self._groups = {}  # (language pair, strict) -> _Group still accepting requests
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def validate(self, source, translation, language_pair, strict=False):
+        """ Returns the verbose QuotationValidator.validate result of a segment """
+        key = (language_pair, strict)
+        request = _Request((source, translation))
+
+        with self._lock:
+            self._in_flight += 1
+            group = self._groups.get(key)
+            leader = group is None
+            if leader:
+                group = self._groups[key] = _Group()
+            group.requests.append(request)
+            if len(group.requests) >= self.max_batch or self._in_flight == 1:
+                del self._groups[key]
+                group.full.set()
+
+        try:
+            if leader:
+                group.full.wait(self.window)
+                with self._lock:
+                    if self._groups.get(key) is group:
+                        del self._groups[key]
+                self._run(key, group.requests)
+            else:
+                request.done.wait()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _run(self, key, requests):
+        language_pair, strict = key
+        try:
+            results = list(QuotationValidator.validate_batch(
+                [request.segment for request in requests], language_pair, verbose=True, strict=strict))
+        except Exception:
+            # a malformed segment fails the whole batch; validate one by one so errors stay with their request
+            results = None
+
+        for index, request in enumerate(requests):
+            if results is not None:
+                request.result = results[index]
+                continue
+            source, translation = request.segment
+            try:
+                request.result = QuotationValidator.validate(source, translation, language_pair, verbose=True,
+                                                             strict=strict)
+            except Exception as e:
+                request.error = e
+
+        with self._lock:
+            self.batches += 1
+            self.segments += len(requests)
+        for request in requests:
+            request.done.set()
+
+    @property
+    def average_batch(self):
+        return float(self.segments) / self.batches if self.batches else 0.0
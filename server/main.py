@@ -2,16 +2,116 @@
 from __future__ import absolute_import
 
 import os
+import threading
+import time
 
-from flask import Flask, render_template
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+
+from quotations import QuotationValidator
+from runner import validate_ndjson
+from server.batching import MicroBatcher
+from server.stats import DEFAULT_ENDPOINT, StatsRecorder
 
 app = Flask(__name__)
+app.config['CACHE_PATH'] = os.environ.get('QUOTATIONS_CACHE_PATH')
+# seconds to wait for concurrent requests to batch with; 0 turns micro-batching off
+app.config['BATCH_WINDOW'] = float(os.environ.get('QUOTATIONS_BATCH_WINDOW', 0.002))
+
+stats = StatsRecorder()
+batcher = MicroBatcher(window=app.config['BATCH_WINDOW'])
+_local = threading.local()
+
+# a stream is recorded as one request of its own endpoint, apart from single segments
+STREAM_ENDPOINT = "/validate/stream"
+ENDPOINTS = (DEFAULT_ENDPOINT, STREAM_ENDPOINT)
+
+
+def _cache():
+    """ Returns the ValidationCache of the current thread, or None if caching is off """
+    if not app.config['CACHE_PATH']:
+        return None
+
+    if getattr(_local, 'cache', None) is None:
+        from cache import ValidationCache
+        _local.cache = ValidationCache(app.config['CACHE_PATH'], commit_every=1)
+    return _local.cache
+
+
+def _error_payload(error):
+    return {"type": type(error).__name__, "message": error.args[0] if error.args else ""}
 
 
 @app.route("/")
 def index():
-    return render_template('index.html')
+    endpoints = [(endpoint, stats.snapshot(endpoint)) for endpoint in ENDPOINTS]
+    return render_template('index.html', endpoints=endpoints, bucket_seconds=stats.bucket_seconds)
+
+
+@app.route("/stats")
+def stats_json():
+    return jsonify(bucket_seconds=stats.bucket_seconds, buckets=stats.snapshot(),
+                   endpoints=dict((endpoint, stats.snapshot(endpoint)) for endpoint in ENDPOINTS))
+
+
+@app.route("/validate", methods=["POST"])
+def validate():
+    start = time.time()
+    payload = request.get_json(force=True)
+    source = payload.get("source", u"")
+    translation = payload["translation"]
+    language_pair = payload["language_pair"]
+    strict = bool(payload.get("strict", False))
+
+    cache = _cache()
+    hits = misses = 0
+    if cache is None and app.config['BATCH_WINDOW'] > 0:
+        ok, error = batcher.validate(source, translation, language_pair, strict=strict)
+    elif cache is None:
+        ok, error = QuotationValidator.validate(source, translation, language_pair, verbose=True, strict=strict)
+    else:
+        before = cache.hits
+        ok, error = cache.validate(source, translation, language_pair, verbose=True, strict=strict)
+        hits = cache.hits - before
+        misses = 1 - hits
+
+    stats.record(time.time() - start,
+                 errors=() if ok else (type(error).__name__,),
+                 cache_hits=hits,
+                 cache_misses=misses)
+    return jsonify(ok=ok, error=None if ok else _error_payload(error))
+
+
+@app.route("/validate/stream", methods=["POST"])
+def validate_stream():
+    """ Validates newline delimited JSON segments, streaming a JSON result line per segment
+
+    language_pair and strict may be given as query parameters, for segments without one.
+    """
+    language_pair = request.args.get("language_pair")
+    strict = request.args.get("strict", "").lower() in ("1", "true")
+    body = request.stream
+
+    def generate():
+        start = time.time()
+        errors = {}  # error class name -> count; bounded by the error classes
+
+        def on_result(_, result):
+            if not result[0]:
+                error_name = type(result[1]).__name__
+                errors[error_name] = errors.get(error_name, 0) + 1
+
+        segments = 0
+        for line in validate_ndjson(iter(body.readline, b""), language_pair, strict=strict, on_result=on_result):
+            segments += 1
+            yield line
+
+        stats.record(time.time() - start, segments=segments,
+                     errors=(name for name, count in errors.items() for _ in range(count)),
+                     endpoint=STREAM_ENDPOINT)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 if __name__ == "__main__":
-    app.run()
+    # requests are served in threads so that concurrent ones can be micro-batched
+    app.run(threaded=True)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+""" Validation over a Unix domain socket, for services on the same host
+
+Every frame is a big endian uint32 length followed by that many bytes of body.
+
+Request body:
+
+    uint8   op              OP_PAIR or OP_VALIDATE
+    uint32  request id      echoed back in the response
+    uint16  pair id         language pair, as returned by OP_PAIR (unused by OP_PAIR)
+    uint8   flags           FLAG_STRICT
+    OP_PAIR:      the language pair, e.g. en_fr, in ASCII
+    OP_VALIDATE:  uint32 length of the source, the source then the translation in UTF-8
+
+Response body:
+
+    uint32  request id
+    uint8   status          STATUS_VALID, STATUS_INVALID or STATUS_ERROR
+    uint8   error class     position in columnar.ERROR_CLASSES, 0 if none
+    OP_PAIR:      uint16 pair id if valid, else the error message in UTF-8
+    OP_VALIDATE:  the error message in UTF-8, empty if valid
+
+Requests may be pipelined; responses come back in request order. Pair ids are
+shared by every connection, and pairs given to the server at start are
+numbered from 0 in that order, with their validators built up front.
+"""
+from __future__ import absolute_import
+
+import argparse
+import os
+import socket
+import stat
+import struct
+import threading
+
+try:
+    from socketserver import BaseRequestHandler, ThreadingUnixStreamServer
+except ImportError:  # python 2
+    from SocketServer import BaseRequestHandler, ThreadingUnixStreamServer
+
+from columnar import ERROR_CLASSES
+from errors import QuotationValidationError
+from quotations import LanguagePairValidator
+from utils import quotation_pattern, quotation_table
+
+OP_PAIR = 1
+OP_VALIDATE = 2
+
+FLAG_STRICT = 1
+
+STATUS_VALID = 0
+STATUS_INVALID = 1
+STATUS_ERROR = 2
+
+MAX_FRAME = 16 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+_REQUEST = struct.Struct(">BIHB")
+_RESPONSE = struct.Struct(">IBB")
+_PAIR_ID = struct.Struct(">H")
+
+
+def _error_class(error):
+    name = type(error).__name__
+    return ERROR_CLASSES.index(name) if name in ERROR_CLASSES else ERROR_CLASSES.index("QuotationValidationError")
+
+
+def _message(error):
+    message = error.args[0] if error.args else u""
+    if isinstance(message, bytes):
+        message = message.decode('utf-8')
+    return message.encode('utf-8')
+
+
+def encode_request(request_id, op, pair_id=0, flags=0, source=u"", translation=u""):
+    """ Returns the frame of a request; for OP_PAIR, translation is the language pair """
+    if op == OP_PAIR:
+        payload = translation.encode('ascii')
+    else:
+        source = source.encode('utf-8')
+        payload = _LENGTH.pack(len(source)) + source + translation.encode('utf-8')
+    body = _REQUEST.pack(op, request_id, pair_id, flags) + payload
+    return _LENGTH.pack(len(body)) + body
+
+
+def _response(request_id, status, error_class=0, payload=b""):
+    body = _RESPONSE.pack(request_id, status, error_class) + payload
+    return _LENGTH.pack(len(body)) + body
+
+
+class SidecarHandler(BaseRequestHandler):
+    """ Serves the requests of a connection, answering every complete frame received in one write """
+
+    def setup(self):
+        # validators keep scratch buffers, so each connection gets its own
+        self.validators = [LanguagePairValidator(language_pair) for language_pair in self.server.language_pairs]
+
+    def handle(self):
+        buffer = bytearray()
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            buffer += data
+
+            responses = []
+            consumed = 0
+            oversized = False
+            while len(buffer) - consumed >= _LENGTH.size:
+                length, = _LENGTH.unpack_from(buffer, consumed)
+                if length > MAX_FRAME:
+                    # framing is lost; answer what was read so far and hang up
+                    oversized = True
+                    break
+                end = consumed + _LENGTH.size + length
+                if len(buffer) < end:
+                    break
+                responses.append(self.respond(bytes(buffer[consumed + _LENGTH.size:end])))
+                consumed = end
+
+            if responses:
+                self.request.sendall(b"".join(responses))
+            if oversized:
+                return
+            del buffer[:consumed]
+
+    def respond(self, body):
+        """ Returns the response frame of a request body, a STATUS_ERROR one if it cannot be served """
+        if len(body) < _REQUEST.size:
+            return _response(0, STATUS_ERROR, payload=b"truncated request")
+        request_id = _REQUEST.unpack_from(body)[1]
+        try:
+            return self._respond(body)
+        except Exception as e:
+            return _response(request_id, STATUS_ERROR, payload=u"{}: {}".format(
+                type(e).__name__, e).encode('utf-8', 'replace'))
+
+    def _respond(self, body):
+        op, request_id, pair_id, flags = _REQUEST.unpack_from(body)
+
+        if op == OP_PAIR:
+            try:
+                pair_id = self.server.pair_id(body[_REQUEST.size:].decode('ascii'))
+            except (QuotationValidationError, UnicodeDecodeError) as e:
+                return _response(request_id, STATUS_ERROR, _error_class(e), _message(e))
+            return _response(request_id, STATUS_VALID, payload=_PAIR_ID.pack(pair_id))
+
+        if op != OP_VALIDATE:
+            return _response(request_id, STATUS_ERROR, payload=b"unknown op")
+
+        validator = self.validator(pair_id)
+        if validator is None:
+            return _response(request_id, STATUS_ERROR, payload=b"unknown pair id")
+
+        offset = _REQUEST.size + _LENGTH.size
+        if len(body) < offset:
+            return _response(request_id, STATUS_ERROR, payload=b"truncated request")
+        source_length, = _LENGTH.unpack_from(body, _REQUEST.size)
+        if offset + source_length > len(body):
+            return _response(request_id, STATUS_ERROR, payload=b"source length exceeds the request")
+        try:
+            source = body[offset:offset + source_length].decode('utf-8')
+            translation = body[offset + source_length:].decode('utf-8')
+        except UnicodeDecodeError as e:
+            return _response(request_id, STATUS_ERROR, payload=str(e).encode('utf-8'))
+
+        ok, error = validator.validate(source, translation, verbose=True, strict=bool(flags & FLAG_STRICT))
+        if ok:
+            return _response(request_id, STATUS_VALID)
+        return _response(request_id, STATUS_INVALID, _error_class(error), _message(error))
+
+    def validator(self, pair_id):
+        """ Returns the LanguagePairValidator of a pair id of this connection, or None if unknown """
+        validators = self.validators
+        if pair_id >= len(validators):
+            language_pairs = self.server.language_pairs
+            if pair_id >= len(language_pairs):
+                return None
+            validators.extend(LanguagePairValidator(language_pair)
+                              for language_pair in language_pairs[len(validators):])
+        return validators[pair_id]
+
+
+class SidecarServer(ThreadingUnixStreamServer):
+    """ Serves validation requests on a Unix domain socket, a thread per connection """
+
+    daemon_threads = True
+
+    def __init__(self, path, language_pairs=()):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)  # left over by a previous run
+
+        self.language_pairs = []
+        self._pair_ids = {}
+        self._lock = threading.Lock()
+        for language_pair in language_pairs:
+            self.pair_id(language_pair)
+
+        ThreadingUnixStreamServer.__init__(self, path, SidecarHandler)
+
+    def pair_id(self, language_pair):
+        """ Returns the id of a language pair, numbering it and warming its tables if new
+
+        Raises:
+            LanguageNotSupported if the language pair is not supported
+        """
+        try:
+            return self._pair_ids[language_pair]
+        except KeyError:
+            pass
+
+        validator = LanguagePairValidator(language_pair)
+        for lc in (validator.source_lc, validator.translation_lc):
+            quotation_table(lc)
+            quotation_pattern(lc)
+
+        with self._lock:
+            if language_pair not in self._pair_ids:
+                self._pair_ids[language_pair] = len(self.language_pairs)
+                self.language_pairs.append(language_pair)
+            return self._pair_ids[language_pair]
+
+    def server_close(self):
+        ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class SidecarClient(object):
+    """ Reference client of the sidecar; sends requests in pipelined windows """
+
+    def __init__(self, path, window=256):
+        self.window = window
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._buffer = bytearray()
+        self._pair_ids = {}
+        self._request_id = 0
+
+    def _next_id(self):
+        self._request_id = (self._request_id + 1) & 0xffffffff
+        return self._request_id
+
+    def _receive(self):
+        """ Returns (request id, status, error class, payload) of the next response """
+        while True:
+            if len(self._buffer) >= _LENGTH.size:
+                length, = _LENGTH.unpack_from(self._buffer)
+                end = _LENGTH.size + length
+                if len(self._buffer) >= end:
+                    body = bytes(self._buffer[_LENGTH.size:end])
+                    del self._buffer[:end]
+                    return _RESPONSE.unpack_from(body) + (body[_RESPONSE.size:],)
+            data = self._socket.recv(65536)
+            if not data:
+                raise EOFError("sidecar closed the connection")
+            self._buffer += data
+
+    def pair_id(self, language_pair):
+        """ Returns the pair id of a language pair; raises ValueError if it is not supported """
+        if language_pair not in self._pair_ids:
+            self._socket.sendall(encode_request(self._next_id(), OP_PAIR, translation=language_pair))
+            _, status, _, payload = self._receive()
+            if status != STATUS_VALID:
+                raise ValueError(payload.decode('utf-8'))
+            self._pair_ids[language_pair], = _PAIR_ID.unpack(payload)
+        return self._pair_ids[language_pair]
+
+    def validate_many(self, segments, language_pair, strict=False):
+        """ Yields (ok, error class name, message) of (source, translation) segments in order """
+        pair_id = self.pair_id(language_pair)
+        flags = FLAG_STRICT if strict else 0
+        segments = iter(segments)
+        while True:
+            frames = [encode_request(self._next_id(), OP_VALIDATE, pair_id, flags, source, translation)
+                      for _, (source, translation) in zip(range(self.window), segments)]
+            if not frames:
+                break
+            self._socket.sendall(b"".join(frames))
+            for _ in frames:
+                _, status, error_class, payload = self._receive()
+                if status == STATUS_ERROR:
+                    raise ValueError(payload.decode('utf-8'))
+                yield status == STATUS_VALID, ERROR_CLASSES[error_class], payload.decode('utf-8')
+
+    def validate(self, source, translation, language_pair, strict=False):
+        """ Returns (ok, error class name, message) of a segment """
+        return next(self.validate_many([(source, translation)], language_pair, strict=strict))
+
+    def close(self):
+        self._socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve quotation validation on a Unix domain socket")
+    parser.add_argument("path")
+    parser.add_argument("language_pairs", nargs="*", help="language pairs to number and warm up, e.g. en_fr")
+    arguments = parser.parse_args(argv)
+
+    server = SidecarServer(arguments.path, arguments.language_pairs)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import threading
+import time
+
+
+# upper bounds (in seconds) of latency histogram bins; 50us growing by 25% up to ~40s
+LATENCY_BOUNDS = tuple(0.00005 * 1.25 ** i for i in range(62))
+
+DEFAULT_ENDPOINT = "/validate"
+
+
+class _Bucket(object):
+
+    __slots__ = ('start', 'requests', 'segments', 'failed', 'errors', 'cache_hits', 'cache_misses', 'latencies')
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, start):
+        self.start = start
+        self.requests = 0
+        self.segments = 0
+        self.failed = 0
+        self.errors = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latencies = [0] * (len(LATENCY_BOUNDS) + 1)
+
+    def percentile(self, ratio):
+        """ Returns the upper bound latency (in seconds) under which ratio of requests completed """
+        if not self.requests:
+            return None
+        rank = ratio * self.requests
+        seen = 0
+        for index, count in enumerate(self.latencies):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BOUNDS[index] if index < len(LATENCY_BOUNDS) else float('inf')
+        return LATENCY_BOUNDS[-1]
+
+
+class StatsRecorder(object):
+    """ In-process ring buffer of validation server statistics
+
+    Time is cut in buckets of bucket_seconds; only the last `buckets` of them are kept.
+    Every endpoint has its own ring, so that latencies of requests of different
+    shapes (a segment, a whole stream) are never mixed in the same percentiles.
+    Recording is O(1) and reading a snapshot never touches logs or storage.
+    """
+
+    def __init__(self, bucket_seconds=10, buckets=60, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self._size = buckets
+        self._rings = {}  # endpoint -> list of _Bucket
+        self._lock = threading.Lock()
+
+    @property
+    def endpoints(self):
+        """ Sorted endpoints recorded so far """
+        with self._lock:
+            return sorted(self._rings)
+
+    def _bucket(self, now, endpoint):
+        ring = self._rings.get(endpoint)
+        if ring is None:
+            ring = self._rings[endpoint] = [_Bucket() for _ in range(self._size)]
+
+        epoch = int(now // self.bucket_seconds)
+        bucket = ring[epoch % len(ring)]
+        if bucket.start != epoch * self.bucket_seconds:
+            # slot was last used a full ring ago
+            bucket.reset(epoch * self.bucket_seconds)
+        return bucket
+
+    def record(self, latency, segments=1, errors=(), cache_hits=0, cache_misses=0, endpoint=DEFAULT_ENDPOINT):
+        """ Records a served request of an endpoint
+
+        errors is an iterable of the error class names of failed segments.
+        """
+        index = 0
+        while index < len(LATENCY_BOUNDS) and latency > LATENCY_BOUNDS[index]:
+            index += 1
+
+        with self._lock:
+            bucket = self._bucket(self.clock(), endpoint)
+            bucket.requests += 1
+            bucket.segments += segments
+            bucket.cache_hits += cache_hits
+            bucket.cache_misses += cache_misses
+            bucket.latencies[index] += 1
+            for error_name in errors:
+                bucket.failed += 1
+                bucket.errors[error_name] = bucket.errors.get(error_name, 0) + 1
+
+    def snapshot(self, endpoint=DEFAULT_ENDPOINT):
+        """ Returns a list of per bucket statistics of an endpoint, oldest first """
+        now = self.clock()
+        oldest = (int(now // self.bucket_seconds) - self._size + 1) * self.bucket_seconds
+
+        with self._lock:
+            buckets = sorted(
+                (bucket for bucket in self._rings.get(endpoint, ()) if bucket.start is not None and bucket.start >= oldest),
+                key=lambda bucket: bucket.start
+            )
+            rows = []
+            for bucket in buckets:
+                lookups = bucket.cache_hits + bucket.cache_misses
+                rows.append({
+                    "start": bucket.start,
+                    "requests": bucket.requests,
+                    "segments": bucket.segments,
+                    "throughput": float(bucket.segments) / self.bucket_seconds,
+                    "failed": bucket.failed,
+                    "errors": dict(bucket.errors),
+                    "p50": bucket.percentile(0.5),
+                    "p95": bucket.percentile(0.95),
+                    "p99": bucket.percentile(0.99),
+                    "cache_hit_rate": float(bucket.cache_hits) / lookups if lookups else None,
+                })
+        return rows
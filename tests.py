@@ -5,7 +5,7 @@ import unittest
 
 import constants
 from models import Quotation
-from quotations import QuotationValidator
+from quotations import LanguagePairValidator, QuotationValidator
 
 
 class TestQuotationMap(unittest.TestCase):
@@ -41,7 +41,8 @@ class TestQuotation(unittest.TestCase):
         for test in tests:
             q = Quotation.create(test["lc"], test["char"], force_close=("close" in test))
             self.assertTrue(q)
-            self.assertEqual(str(q), test["char"].encode('utf-8'))
+            self.assertEqual(q.char, test["char"])
+            self.assertEqual(str(q), test["char"] if str is not bytes else test["char"].encode('utf-8'))
 
     def test_mirror(self):
         """ Test that a QuotationNotFound is raised when unsupported languages or quotations requested """
@@ -58,6 +59,50 @@ class TestQuotation(unittest.TestCase):
             self.assertTrue(opening ^ closing)
 
 
+class TestExtractor(unittest.TestCase):
+
+    def test_is_word_character(self):
+        """ Test that is_word_character agrees with the \\w regular expression it replaces """
+        import re
+        from libs import is_word_character
+
+        pattern = re.compile(u'\\w')
+        for codepoint in range(0x3100):
+            char = chr(codepoint) if str is not bytes else unichr(codepoint)
+            self.assertEqual(is_word_character(char), bool(pattern.match(char)), msg=repr(char))
+
+    def test_scan_stops(self):
+        """ Test that scan_quotations reports lone rangers and stops when a callback returns True """
+        from libs import QuotationHandler, scan_quotations
+
+        class FirstLoneRanger(QuotationHandler):
+            found = None
+
+            def lone_ranger(self, index, char):
+                self.found = index
+                return True  # stop
+
+        handler = FirstLoneRanger()
+        self.assertEqual(scan_quotations(u"'It's dog's'", constants.LC_ENGLISH, handler), 1)
+        self.assertEqual(handler.found, 3)
+
+    def test_no_regular_expressions_on_import(self):
+        """ Test that importing the library only loads its own modules (and codecs); no re or threading """
+        import os
+        import subprocess
+        import sys
+
+        output = subprocess.check_output(
+            [sys.executable, "-c",
+             "import sys; before = set(sys.modules); import quotations; "
+             "print(' '.join(sorted(name for name in set(sys.modules) - before "
+             "if name != '__future__' and not name.startswith('encodings.'))))"],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.assertEqual(output.split(), [b"compat", b"constants", b"errors", b"libs", b"models", b"quotations",
+                                          b"utils"])
+
+
 class TestQuotationValid(unittest.TestCase):
 
     def test_validate_success(self):
@@ -971,5 +1016,1278 @@ L'équipe Always Riding
         """ Test to check that source and translation have equal amount and order of quotations """
         pass
 
+
+class TestLanguagePairValidator(unittest.TestCase):
+
+    def test_matches_static_validate(self):
+        """ Test that a bound validator gives the same results as QuotationValidator.validate """
+        tests = [
+            (u"'Hello world,' she said.", u"«Bonjour tout le monde», dit-elle."),
+            (u"'Hello world,' she said.", u"\"Bonjour tout le monde, dit-elle."),
+            (u"'Hello' and 'bye'", u"\"Bonjour\" et au revoir"),
+            (u"l'homme", u"l'homme"),
+            (u"", u""),
+        ]
+        validator = LanguagePairValidator("{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH))
+
+        for strict in (False, True):
+            for source, translation in tests:
+                expected = QuotationValidator.validate(source, translation, validator.language_pair,
+                                                       verbose=True, strict=strict)
+                ok, e = validator.validate(source, translation, verbose=True, strict=strict)
+                self.assertEqual(ok, expected[0], msg=u"{} {}".format(source, translation))
+                self.assertEqual(type(e), type(expected[1]))
+
+    def test_buffers_grow(self):
+        """ Test that scratch buffers are sized to the largest segment seen """
+        validator = LanguagePairValidator("{}_{}".format(constants.LC_JAPANESE, constants.LC_JAPANESE), strict=True)
+
+        self.assertTrue(validator.validate(u"「あ」", u"「あ」"))
+        self.assertTrue(validator.validate(u"「あ」" * 50, u"「あ」" * 50))
+        self.assertEqual(validator._capacity, 150)
+        self.assertTrue(validator.validate(u"「あ」", u"「あ」"))
+        self.assertEqual(validator._capacity, 150)
+
+    def test_language_not_supported(self):
+        """ Test that binding to an unsupported language pair raises LanguageNotSupported """
+        from errors import LanguageNotSupported
+
+        self.assertRaises(LanguageNotSupported, LanguagePairValidator, "en_klingon")
+
+    def test_language_codes_with_underscore(self):
+        """ Test that language pairs made of language codes with an underscore are supported """
+        self.assertEqual(LanguagePairValidator("es_la_en").source_lc, constants.LC_SPANISH_LATIN)
+        self.assertEqual(LanguagePairValidator("en_es_la").translation_lc, constants.LC_SPANISH_LATIN)
+        self.assertTrue(QuotationValidator.validate(u"'Hola,' dijo.", u"«Hola», dijo.", "en_es_la", strict=True))
+
+
+class TestQuotationSpans(unittest.TestCase):
+
+    def test_spans(self):
+        """ Test that matched quotations are returned as spans with their nesting depth """
+        text = u"«Bonjour», dit-elle, «au revoir»"
+        spans = QuotationValidator.validate_open_close(text, constants.LC_FRENCH)
+        self.assertEqual([text[start:end] for start, end, _ in spans], [u"«Bonjour»", u"«au revoir»"])
+        self.assertEqual(list(spans.depths), [0, 0])
+        self.assertEqual(list(spans.unmatched), [])
+
+    def test_unmatched(self):
+        """ Test that unmatched quotations are left out of the spans, and raised by validate_open_close """
+        from errors import QuotationMissingPair
+        from libs import quotation_spans
+        from utils import QUOTATION_MAP
+
+        text = u"«un» “deux"
+        spans = quotation_spans(text, constants.LC_FRENCH)
+        self.assertEqual(list(spans), [(0, 4, 0)])
+        self.assertEqual(list(spans.unmatched), [5])
+        self.assertEqual(list(spans.unmatched_positions), [QUOTATION_MAP[constants.LC_FRENCH].index(u"“")])
+        self.assertRaises(QuotationMissingPair, QuotationValidator.validate_open_close, text, constants.LC_FRENCH)
+
+
+class TestDocumentValidator(unittest.TestCase):
+
+    def test_across_segments(self):
+        """ Test that quotations may close segments after they open """
+        from quotations import DocumentValidator
+
+        validator = DocumentValidator(constants.LC_FRENCH)
+        segments = [(1, u"«Il a dit"), (2, u"bonjour,"), (3, u"puis au revoir», dit-elle.")]
+        self.assertFalse(QuotationValidator.validate(u"", segments[0][1], "en_fr"))
+        self.assertFalse(QuotationValidator.validate(u"", segments[2][1], "en_fr"))
+        self.assertEqual(validator.validate(segments, verbose=True), (True, ""))
+
+        # neutral quotations carry their open or close state to the next segment
+        self.assertTrue(validator.validate([(1, u"\"Il a dit"), (2, u"bonjour.\" Puis")]))
+
+    def test_unmatched(self):
+        """ Test that orphaned quotations are reported with the segments they span """
+        from errors import LanguageNotSupported, QuotationMissingPair
+        from quotations import DocumentValidator
+
+        validator = DocumentValidator(constants.LC_FRENCH)
+        for segment, text in [(1, u"«Il a dit"), (2, u"bonjour"), (3, u"au revoir.")]:
+            validator.feed(segment, text)
+        self.assertEqual(validator.unmatched(), [(1, 0, u"«", 1, 3)])
+
+        ok, error = validator.close(verbose=True)
+        self.assertFalse(ok)
+        self.assertIsInstance(error, QuotationMissingPair)
+        self.assertEqual(error.args[0], u"there are orphaned quotations: [« in 1 (from 1 to 3)]")
+
+        # closed documents leave nothing behind
+        self.assertTrue(validator.validate([(1, u"«oui»")]))
+        self.assertRaises(LanguageNotSupported, DocumentValidator, "xx")
+
+    def test_subtitles(self):
+        """ Test that SRT and WebVTT cues are validated as one stream """
+        from formats import iter_subtitles
+        from quotations import DocumentValidator
+
+        srt = u"""\ufeff1
+00:00:01,000 --> 00:00:02,000
+«Il a dit
+
+2
+00:00:02,500 --> 00:00:04,000
+<i>bonjour»</i>
+et «au revoir
+
+"""
+        vtt = u"""WEBVTT
+
+NOTE a quoted «note
+
+intro
+00:01.000 --> 00:02.000
+«Bonjour
+
+00:02.500 --> 00:04.000
+dit-elle»
+"""
+        self.assertEqual(list(iter_subtitles(srt.encode('utf-8').splitlines(True))),
+                         [(3, u"", u"«Il a dit"), (7, u"", u"<i>bonjour»</i>\net «au revoir")])
+        self.assertEqual([location for location, _, _ in iter_subtitles(vtt.splitlines(True))], [7, 10])
+
+        validator = DocumentValidator(constants.LC_FRENCH)
+        self.assertEqual(
+            validator.validate((location, text) for location, _, text in iter_subtitles(srt.splitlines(True))),
+            False)
+        self.assertTrue(validator.validate((location, text) for location, _, text in iter_subtitles(vtt.splitlines())))
+
+
+class TestPrefilter(unittest.TestCase):
+
+    def test_hit_rate(self):
+        """ Test that quotation free segments are accepted by the prefilter, alone or in batches """
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        segments = [(u"Hello world", u"Bonjour tout le monde")] * 6 + [(u"'Hello,' she said.", u"\"Bonjour")] * 2
+
+        validator = LanguagePairValidator(language_pair)
+        results = list(validator.validate_many(segments, chunk=4))
+        self.assertEqual(results, [True] * 6 + [False] * 2)
+        self.assertEqual((validator.prefilter.checked, validator.prefilter.accepted), (8, 6))
+
+        self.assertTrue(validator.validate(u"'Hello,' she said.", u"Bonjour"))
+        self.assertFalse(validator.validate(u"'Hello,' she said.", u"Bonjour", strict=True))
+        self.assertEqual((validator.prefilter.checked, validator.prefilter.accepted), (10, 7))
+        self.assertAlmostEqual(validator.prefilter.hit_rate, 0.7)
+
+        # a chunk of one segment, e.g. the remainder of a batch, is counted once
+        validator = LanguagePairValidator(language_pair)
+        self.assertEqual(list(validator.validate_many([(u"", u"«x")] * 5, chunk=4)), [False] * 5)
+        self.assertEqual((validator.prefilter.checked, validator.prefilter.accepted), (5, 0))
+
+    def test_static_validate(self):
+        """ Test that quotation free segments pass QuotationValidator.validate without extraction """
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+
+        self.assertEqual(QuotationValidator.validate(u"", u"Bonjour", language_pair, verbose=True), (True, ""))
+        self.assertFalse(QuotationValidator.validate(u"'Hello,' she said.", u"Bonjour", language_pair, strict=True))
+
+
+class TestQuotationStyleDetector(unittest.TestCase):
+
+    def test_detect(self):
+        """ Test that the quotation convention of texts is recognised """
+        from detect import QuotationStyleDetector
+
+        detector = QuotationStyleDetector()
+        tests = [
+            ([u"«Bonjour», dit-elle.", u"Il a dit «oui» et “non”."], constants.LC_FRENCH),
+            ([u"„Hallo“, sagte sie.", u"Er sagte ‚ja‘."], constants.LC_GERMAN),
+            ([u"「世界こんにちは」と彼女は言いました。"], constants.LC_JAPANESE),
+            ([u"“สวัสดี” เธอกล่าว", u"‘ใช่’"], constants.LC_THAI),
+            ([u"'Hello,' she said.", u"No quotations"], constants.LC_ENGLISH),
+        ]
+        for texts, lc in tests:
+            self.assertEqual(detector.detect(texts), lc, msg=texts)
+
+    def test_language_pair(self):
+        """ Test that language pairs are inferred once per file """
+        from detect import QuotationStyleDetector
+
+        detector = QuotationStyleDetector()
+        segments = [(u"「世界こんにちは」と彼女は言いました。", u"«Bonjour tout le monde», dit-elle.")]
+        language_pair = detector.language_pair("a.po", segments)
+        self.assertEqual(language_pair, "{}_{}".format(constants.LC_JAPANESE, constants.LC_FRENCH))
+        self.assertEqual(detector.language_pair("a.po", []), language_pair)
+        self.assertTrue(QuotationValidator.validate(segments[0][0], segments[0][1], language_pair, strict=True))
+
+        detector.forget("a.po")
+        self.assertEqual(detector.language_pair("a.po", []), "{}_{}".format(constants.LC_ENGLISH, constants.LC_ENGLISH))
+
+        # generators are read once for both languages
+        self.assertEqual(detector.language_pair("b.po", (segment for segment in segments)),
+                         "{}_{}".format(constants.LC_JAPANESE, constants.LC_FRENCH))
+
+
+class TestConfusables(unittest.TestCase):
+
+    def test_translation_table(self):
+        """ Test that lookalikes map to quotations of the language, keeping offsets """
+        from utils import confusable_table
+
+        self.assertEqual(u"＂‹a›＂｢b｣".translate(confusable_table(constants.LC_FRENCH)), u"\"«a»\"｢b｣")
+        self.assertEqual(u"＂‹a›＂｢b｣".translate(confusable_table(constants.LC_JAPANESE)), u"\"'a'\"「b」")
+
+    def test_create(self):
+        """ Test that Quotation.create recognises lookalikes when asked to """
+        from errors import QuotationNotFound
+
+        self.assertRaises(QuotationNotFound, Quotation.create, constants.LC_JAPANESE, u"｢")
+        self.assertTrue(Quotation.create(constants.LC_JAPANESE, u"｢", normalize=True) ^
+                        Quotation.create(constants.LC_JAPANESE, u"｣", force_close=True, normalize=True))
+
+    def test_validate(self):
+        """ Test that quotations written with lookalikes are not missed when normalizing """
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_JAPANESE)
+        source, translation = u"'Hello world,' she said.", u"｢世界こんにちは｣と彼女は言いました。"
+
+        self.assertFalse(QuotationValidator.validate(source, translation, language_pair, strict=True))
+        self.assertTrue(QuotationValidator.validate(source, translation, language_pair, strict=True, normalize=True))
+        self.assertTrue(LanguagePairValidator(language_pair, strict=True, normalize=True).validate(source, translation))
+        self.assertTrue(next(QuotationValidator.validate_batch([(source, translation)], language_pair,
+                                                               strict=True, normalize=True)))
+
+
+class TestValidateTargets(unittest.TestCase):
+
+    source = u"'Hello world,' she said."
+    translations = {
+        constants.LC_FRENCH: u"«Bonjour tout le monde», dit-elle.",
+        constants.LC_SPANISH_LATIN: u"«Hola mundo», dijo ella.",
+        constants.LC_JAPANESE: u"世界こんにちはと彼女は言いました。",
+        constants.LC_GERMAN: u"\"Hallo Welt, sagte sie.",
+        "klingon": u"'Hello world,' she said.",
+    }
+
+    def test_validate_targets(self):
+        """ Test that every target gets the same result as validating it on its own """
+        from multiprocessing.dummy import Pool
+
+        pool = Pool(2)
+        self.addCleanup(pool.close)
+
+        for strict in (False, True):
+            for worker_pool in (None, pool):
+                results = QuotationValidator.validate_targets(self.source, constants.LC_ENGLISH, self.translations,
+                                                              verbose=True, strict=strict, pool=worker_pool)
+                self.assertEqual(sorted(results), sorted(self.translations))
+                for lc, translation in self.translations.items():
+                    expected = QuotationValidator.validate(self.source, translation, "en_{}".format(lc),
+                                                           verbose=True, strict=strict)
+                    self.assertEqual(results[lc][0], expected[0], msg=lc)
+                    self.assertEqual(type(results[lc][1]), type(expected[1]), msg=lc)
+
+    def test_validators_reused(self):
+        """ Test that targets reuse one validator per language pair and skip the source prefilter """
+        from quotations import _target_validator
+
+        validator = _target_validator("en_fr")
+        checked = validator.prefilter.checked
+        for _ in range(2):
+            results = QuotationValidator.validate_targets(self.source, constants.LC_ENGLISH, self.translations,
+                                                          strict=True)
+            self.assertTrue(results[constants.LC_FRENCH])
+        self.assertTrue(_target_validator("en_fr") is validator)
+        self.assertEqual(validator.prefilter.checked, checked)
+
+
+class TestValidationCache(unittest.TestCase):
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = "{}/cache/results.sqlite".format(self.directory)
+
+    def test_reuse(self):
+        """ Test that repeat runs are answered from the cache with the same results """
+        from cache import ValidationCache
+        from errors import QuotationMissingPair
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        tests = [u"«Bonjour», dit-elle.", u"\"Bonjour, dit-elle."]
+
+        for run in range(2):
+            with ValidationCache(self.path) as cache:
+                ok, e = cache.validate(u"'Hello,' she said.", tests[0], language_pair, verbose=True)
+                self.assertTrue(ok)
+                ok, e = cache.validate(u"'Hello,' she said.", tests[1], language_pair, verbose=True)
+                self.assertFalse(ok)
+                self.assertTrue(isinstance(e, QuotationMissingPair))
+                self.assertEqual((cache.hits, cache.misses), (2, 0) if run else (0, 2))
+
+    def test_invalidation(self):
+        """ Test that cached results are dropped when the ruleset changes """
+        from cache import ValidationCache
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        with ValidationCache(self.path) as cache:
+            cache.validate(u"'Hello,' she said.", u"«Bonjour», dit-elle.", language_pair)
+
+        with ValidationCache(self.path, fingerprint="changed") as cache:
+            cache.validate(u"'Hello,' she said.", u"«Bonjour», dit-elle.", language_pair)
+            self.assertEqual(cache.misses, 1)
+
+
+class TestValidationReport(unittest.TestCase):
+
+    segments = [
+        (u"'Hello,' she said.", u"«Bonjour», dit-elle."),
+        (u"'Hello,' she said.", u"\"Bonjour, dit-elle."),
+        (u"'Hello,' she said.", u"«Bonjour», dit-elle."),
+    ]
+
+    def _report(self, files, top=10):
+        from reports import ValidationReport
+
+        report = ValidationReport(top=top)
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        for filename, segments in files:
+            results = QuotationValidator.validate_batch(segments, language_pair, verbose=True)
+            list(report.consume(results, language_pair, filename=filename))
+        return report
+
+    def test_accumulate(self):
+        """ Test that counters and worst files are accumulated while streaming results """
+        report = self._report([("a.po", self.segments), ("b.po", self.segments[1:2] * 3), ("c.po", self.segments[:1])])
+
+        self.assertEqual((report.total, report.failed, report.files), (7, 4, 3))
+        self.assertEqual(report.errors, {"QuotationMissingPair": 4})
+        self.assertEqual(report.worst_files(), [("b.po", 3, 3), ("a.po", 3, 1)])
+        self.assertAlmostEqual(report.error_rate("en_fr"), 4 / 7.0)
+
+    def test_bounded(self):
+        """ Test that only the top worst files are kept """
+        report = self._report([("{}.po".format(i), self.segments[1:2] * i) for i in range(1, 6)], top=2)
+
+        self.assertEqual(report.worst_files(), [("5.po", 5, 5), ("4.po", 4, 4)])
+
+    def test_merge(self):
+        """ Test that partial reports merge into the same report as a single run """
+        from reports import ValidationReport
+
+        files = [("a.po", self.segments), ("b.po", self.segments[1:2] * 3), ("c.po", self.segments[:1])]
+        expected = self._report(files)
+
+        merged = ValidationReport.from_dict(self._report(files[:1]).to_dict())
+        merged.merge(self._report(files[1:]))
+        self.assertEqual(merged.worst_files(), expected.worst_files())
+        self.assertEqual(merged.errors, expected.errors)
+        self.assertEqual(merged.language_pairs, expected.language_pairs)
+        self.assertEqual((merged.total, merged.failed, merged.files), (expected.total, expected.failed, expected.files))
+
+    def test_merge_split_file(self):
+        """ Test that a file split across partial reports is ranked and counted once """
+        merged = self._report([("a.po", self.segments[1:2]), ("b.po", self.segments[:1])])
+        merged.merge(self._report([("b.po", self.segments[1:2] * 2)]))
+
+        self.assertEqual(merged.files, 2)
+        self.assertEqual(merged.worst_files(), [("b.po", 3, 2), ("a.po", 1, 1)])
+
+
+class CorpusFixture(object):
+    """ Writes a small corpus of 30 segments over 5 files, a third of them failing """
+
+    def setUp(self):
+        import json
+        import shutil
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = "{}/corpus.ndjson".format(self.directory)
+
+        translations = [u"«Bonjour», dit-elle.", u"\"Bonjour, dit-elle.", u"Bonjour"]
+        with open(self.path, "wb") as f:
+            for i in range(30):
+                record = {"source": u"'Hello,' she said.", "translation": translations[i % 3],
+                          "file": "{}.po".format(i // 7)}
+                f.write(json.dumps(record).encode('utf-8') + b"\n")
+
+    def assertSameReport(self, report, expected):
+        self.assertEqual(report.worst_files(), expected.worst_files())
+        self.assertEqual(report.errors, expected.errors)
+        self.assertEqual(report.language_pairs, expected.language_pairs)
+        self.assertEqual((report.total, report.failed, report.files), (expected.total, expected.failed, expected.files))
+
+
+class TestCorpusRunner(CorpusFixture, unittest.TestCase):
+
+    def test_resume(self):
+        """ Test that a run resumed from a checkpoint gives the same report as a single run """
+        from runner import CorpusRunner
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        expected = CorpusRunner(self.path, "{}/a.json".format(self.directory), language_pair).run()
+
+        class Crash(Exception):
+            pass
+
+        runner = CorpusRunner(self.path, "{}/b.json".format(self.directory), language_pair, checkpoint_every=4)
+        save_checkpoint = runner.save_checkpoint
+        saved = []
+
+        def crash_after_three(offset, report):
+            save_checkpoint(offset, report)
+            saved.append(offset)
+            if len(saved) == 3:
+                raise Crash()
+
+        runner.save_checkpoint = crash_after_three
+        self.assertRaises(Crash, runner.run)
+
+        report = CorpusRunner(self.path, "{}/b.json".format(self.directory), language_pair, checkpoint_every=4).run()
+        self.assertEqual(report.to_dict(), expected.to_dict())
+        self.assertEqual((report.total, report.failed), (30, 10))
+
+
+def _dying_worker(address, authkey, marker):
+    """ Worker for TestCoordinator; the first one to create marker dies on its first shard """
+    import os
+
+    from cluster import connect, worker
+
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except OSError:
+        return worker(address, authkey)
+
+    connection = connect(address, authkey)
+    connection.recv()
+    os._exit(1)
+
+
+def _hanging_worker(address, authkey, marker):
+    """ Worker for TestCoordinator; the first one to create marker never answers its first shard """
+    import os
+    import time
+
+    from cluster import connect, worker
+
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except OSError:
+        return worker(address, authkey)
+
+    connection = connect(address, authkey)
+    connection.recv()
+    time.sleep(60)
+
+
+class TestSampledValidation(CorpusFixture, unittest.TestCase):
+
+    def test_full_sample(self):
+        """ Test that sampling every record gives the exact error rate with no margin """
+        from sampling import sample_corpus
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        estimate = sample_corpus(self.path, sample_size=30, language_pair=language_pair, seed=0)
+
+        self.assertEqual((estimate["population"], estimate["sampled"], estimate["strata"]), (30, 30, 5))
+        self.assertAlmostEqual(estimate["error_rate"][0], 1 / 3.0)
+        self.assertAlmostEqual(estimate["error_rate"][1], estimate["error_rate"][2])
+        self.assertEqual(sorted(estimate["errors"]), ["QuotationMissingPair"])
+
+    def test_interval(self):
+        """ Test that the error rate of a sample is bracketed by its confidence interval """
+        from sampling import SampledValidation
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        records = ({"translation": u"\"Bonjour" if i % 4 == 0 else u"«Bonjour»", "file": str(i % 2)}
+                   for i in range(4000))
+        estimate = SampledValidation(sample_size=600, language_pair=language_pair, seed=1).consume(records).estimate()
+
+        self.assertEqual(estimate["sampled"], 600)
+        rate, low, high = estimate["error_rate"]
+        self.assertTrue(low < 0.25 < high)
+        self.assertTrue(low < rate < high)
+        self.assertTrue(high - low < 0.1)
+
+    def test_clean_sample(self):
+        """ Test that a sample without failures still has an upper bound above zero """
+        from sampling import SampledValidation
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        records = ({"translation": u"«Bonjour»", "file": str(i % 3)} for i in range(3000))
+        rate, low, high = SampledValidation(sample_size=300, language_pair=language_pair,
+                                            seed=1).consume(records).estimate()["error_rate"]
+        self.assertEqual((rate, low), (0.0, 0.0))
+        self.assertTrue(0.005 < high < 0.05)
+
+        records = [{"translation": u"\"Bonjour", "file": str(i)} for i in range(2)]
+        rate, low, high = SampledValidation(sample_size=1, language_pair=language_pair, seed=1).consume(
+            records * 5).estimate()["error_rate"]
+        self.assertEqual(rate, 1.0)
+        self.assertTrue(low < 0.9)
+
+    def test_sample_budget(self):
+        """ Test that many small strata share the sample instead of each keeping a sample of their own """
+        from sampling import SampledValidation
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        records = ({"translation": u"\"Bonjour" if i % 10 == 0 else u"«Bonjour»", "file": str(i // 150)}
+                   for i in range(60000))
+        sampling = SampledValidation(sample_size=2000, language_pair=language_pair, seed=1).consume(records)
+        estimate = sampling.estimate()
+
+        self.assertEqual((estimate["population"], estimate["strata"]), (60000, 400))
+        self.assertTrue(2000 <= estimate["sampled"] <= 2400)
+        self.assertTrue(all(stratum.sample for stratum in sampling.strata.values()))
+        rate, low, high = estimate["error_rate"]
+        self.assertTrue(low < 0.1 < high)
+
+
+class TestValidateNdjson(unittest.TestCase):
+
+    def test_stream(self):
+        """ Test that NDJSON segments are validated into NDJSON results one line at a time """
+        import json
+        from runner import validate_ndjson
+
+        lines = iter([
+            b'{"source": "\'Hello,\' she said.", "translation": "\\"Bonjour, dit-elle."}\n',
+            b"\n",
+            json.dumps({"translation": u"«Bonjour», dit-elle.", "language_pair": "en_fr"}).encode('utf-8') + b"\n",
+        ])
+        results = validate_ndjson(lines, "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH))
+
+        first = json.loads(next(results))
+        self.assertEqual((first["index"], first["ok"], first["error"]["type"]), (0, False, "QuotationMissingPair"))
+        self.assertEqual(json.loads(next(results)), {"index": 1, "ok": True, "error": None})
+        self.assertEqual(list(results), [])
+
+    def test_bad_lines(self):
+        """ Test that lines which are not segments get an error result without ending the stream """
+        import json
+        from runner import validate_ndjson
+
+        lines = [b"{not json\n", b'{"source": "x"}\n', b'{"translation": "oui"}\n', b"[1]\n",
+                 b'{"translation": "\\u00abBonjour\\u00bb", "language_pair": "en_fr"}\n']
+        results = [json.loads(line) for line in validate_ndjson(iter(lines))]
+        self.assertEqual([(result["ok"], result["error"] and result["error"]["type"]) for result in results], [
+            (False, "ValueError"),
+            (False, "ValueError"),
+            (False, "LanguageNotSupported"),
+            (False, "ValueError"),
+            (True, None),
+        ])
+
+    def test_validators_bounded(self):
+        """ Test that validators are cached per language codes, up to a limit, and bad pairs are not cached """
+        from runner import SegmentValidator
+
+        validator = SegmentValidator(max_validators=2)
+        for index in range(100):
+            ok, _ = validator.validate({"translation": u"«oui»", "language_pair": "en_xx{}".format(index)})[1]
+            self.assertFalse(ok)
+        self.assertEqual(len(validator._validators), 0)
+
+        for language_pair in ["en_fr", "en_fr", "ja_en", "en_de"]:
+            self.assertTrue(validator.validate({"translation": u"oui", "language_pair": language_pair})[1][0])
+        self.assertEqual(list(validator._validators), [("ja", "en"), ("en", "de")])
+
+
+class TestCoordinator(CorpusFixture, unittest.TestCase):
+
+    def test_split_shards(self):
+        """ Test that shards cover the whole corpus and start at record boundaries """
+        import os
+        from cluster import split_shards
+
+        shards = split_shards(self.path, 7)
+        self.assertEqual(shards[0][0], 0)
+        self.assertEqual(shards[-1][1], os.path.getsize(self.path))
+        with open(self.path, "rb") as f:
+            for (start, end), (next_start, _) in zip(shards, shards[1:]):
+                self.assertEqual(end, next_start)
+                f.seek(next_start - 1)
+                self.assertEqual(f.read(1), b"\n")
+
+    def test_run(self):
+        """ Test that sharded runs match a single run, even when a worker dies """
+        from cluster import Coordinator
+        from runner import CorpusRunner
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        expected = CorpusRunner(self.path, "{}/a.json".format(self.directory), language_pair).run()
+
+        coordinator = Coordinator(self.path, language_pair, workers=2, shards=5)
+        report = coordinator.run()
+        self.assertSameReport(report, expected)
+        self.assertEqual(coordinator.spawned, 2)  # stopped workers are not replaced
+
+        coordinator = Coordinator(self.path, language_pair, workers=2, shards=5, worker=_dying_worker,
+                                  worker_args=("{}/died".format(self.directory),))
+        report = coordinator.run()
+        self.assertEqual(coordinator.reassigned, 1)
+        self.assertTrue(coordinator.spawned <= 3)
+        self.assertSameReport(report, expected)
+
+    def test_hung_worker(self):
+        """ Test that the shard of a worker that stops answering goes to another worker """
+        import time
+        from cluster import Coordinator
+        from runner import CorpusRunner
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        expected = CorpusRunner(self.path, "{}/a.json".format(self.directory), language_pair).run()
+
+        coordinator = Coordinator(self.path, language_pair, workers=1, shards=5, worker=_hanging_worker,
+                                  worker_args=("{}/hung".format(self.directory),), shard_timeout=1)
+        started = time.time()
+        report = coordinator.run()
+        self.assertTrue(time.time() - started < 30)
+        self.assertEqual(coordinator.reassigned, 1)
+        self.assertEqual(coordinator.spawned, 2)  # the hung worker is terminated and replaced
+        self.assertSameReport(report, expected)
+
+    def test_external_workers(self):
+        """ Test that workers started outside the coordinator join it with the shared authkey """
+        import multiprocessing
+        import threading
+        from cluster import Coordinator, worker
+        from runner import CorpusRunner
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        expected = CorpusRunner(self.path, "{}/a.json".format(self.directory), language_pair).run()
+
+        coordinator = Coordinator(self.path, language_pair, workers=0, shards=5, authkey=b"secret")
+        reports = []
+        thread = threading.Thread(target=lambda: reports.append(coordinator.run()))
+        thread.start()
+        self.assertTrue(coordinator.listening.wait(10))
+
+        processes = [multiprocessing.Process(target=worker, args=(coordinator.listener_address, b"secret"))
+                     for _ in range(2)]
+        for process in processes:
+            process.start()
+        thread.join(30)
+        for process in processes:
+            process.join(5)
+        self.assertEqual(coordinator.spawned, 0)
+        self.assertSameReport(reports[0], expected)
+
+
+class TestFormats(unittest.TestCase):
+
+    language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+
+    def test_po(self):
+        """ Test that PO messages, including plurals, are validated with their line numbers """
+        from formats import iter_po, validate_entries
+
+        po = u"""msgid ""
+msgstr ""
+"Language: fr\\n"
+
+#: main.py:1
+msgid "'Hello,' she said."
+msgstr "«Bonjour», dit-elle."
+
+msgctxt "menu"
+msgid "Say 'hi'"
+msgstr ""
+"Dire \\"salut"
+
+msgid "one 'file'"
+msgid_plural "%d 'files'"
+msgstr[0] "un «fichier»"
+msgstr[1] "%d \\"fichiers"
+
+#~ msgid "'obsolete'"
+#~ msgstr "«obsolète"
+"""
+        entries = list(iter_po(po.encode('utf-8').splitlines(True)))
+        self.assertEqual(entries[0], (7, u"'Hello,' she said.", u"«Bonjour», dit-elle."))
+        self.assertEqual(entries[1], (11, u"Say 'hi'", u"Dire \"salut"))
+        self.assertEqual(entries[3], (17, u"%d 'files'", u"%d \"fichiers"))
+
+        results = [(location, ok) for location, ok, _ in validate_entries(iter(entries), self.language_pair)]
+        self.assertEqual(results, [(7, True), (11, False), (16, True), (17, False)])
+
+    def test_mo(self):
+        """ Test that MO messages are read from a memory mapped file """
+        import os
+        import shutil
+        import struct
+        import tempfile
+        from formats import iter_mo
+
+        messages = [(u"", u"Language: fr"), (u"'Hello,' she said.", u"«Bonjour», dit-elle."),
+                    (u"menu\x04one 'file'\x00%d 'files'", u"un «fichier»\x00%d «fichiers")]
+        originals = [source.encode('utf-8') for source, _ in messages]
+        translations = [translation.encode('utf-8') for _, translation in messages]
+
+        offset = 28 + 16 * len(messages)
+        table, data = [], b""
+        for string in originals + translations:
+            table.append(struct.pack("<2I", len(string), offset + len(data)))
+            data += string + b"\x00"
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "fr.mo")
+        with open(path, "wb") as f:
+            f.write(struct.pack("<7I", 0x950412de, 0, len(messages), 28, 28 + 8 * len(messages), 0, 0))
+            f.write(b"".join(table) + data)
+
+        self.assertEqual(list(iter_mo(path)), [
+            (1, u"'Hello,' she said.", u"«Bonjour», dit-elle."),
+            (2, u"one 'file'", u"un «fichier»"),
+            (2, u"%d 'files'", u"%d «fichiers"),
+        ])
+
+    def test_json(self):
+        """ Test that nested JSON bundles are read as key paths with line numbers, whole or in chunks """
+        import io
+        from formats import iter_json_strings
+
+        bundle = u"""{
+  "greeting": "«Bonjour», dit-elle.",
+  "count": 3,
+  "nested": {"items": ["«un»", null, "«deux"], "flag": true, "\\"key\\"": "{{name}} \\"x\\""}
+}"""
+        self.assertEqual(list(iter_json_strings(bundle)), [
+            (u"greeting", u"«Bonjour», dit-elle.", 2),
+            (u"nested.items.0", u"«un»", 4),
+            (u"nested.items.2", u"«deux", 4),
+            (u"nested.\"key\"", u"{{name}} \"x\"", 4),
+        ])
+
+        for chunk_size in range(1, 8):
+            self.assertEqual(list(iter_json_strings(io.StringIO(bundle), chunk_size=chunk_size)),
+                             list(iter_json_strings(bundle)))
+
+    def test_json_bundle(self):
+        """ Test that a JSON bundle is read along with its source bundle, in any key order """
+        import io
+        import os
+        import shutil
+        import tempfile
+        from formats import iter_json_bundle
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        paths = [os.path.join(directory, name) for name in (u"fr.json", u"en.json")]
+        for path, text in zip(paths, [u'{"a": "«un»", "b": {"c": "«deux»"}, "d": "trois", "e": "quatre"}',
+                                      u'{"b": {"c": "\'two\'"}, "a": "\'one\'", "d": "three"}']):
+            with io.open(path, "w", encoding='utf-8') as f:
+                f.write(text)
+
+        self.assertEqual(list(iter_json_bundle(*paths)), [
+            (u"a", u"'one'", u"«un»"),
+            (u"b.c", u"'two'", u"«deux»"),
+            (u"d", u"three", u"trois"),
+            (u"e", u"", u"quatre"),
+        ])
+        self.assertEqual([source for _, source, _ in iter_json_bundle(paths[0])], [u""] * 4)
+
+
+class TestDiffs(unittest.TestCase):
+
+    language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+
+    def test_parse_unified_diff(self):
+        """ Test that added and modified lines are read from git diff hunks """
+        from diffs import parse_unified_diff
+
+        diff = u"""diff --git a/fr.po b/fr.po
+--- a/fr.po
++++ b/fr.po
+@@ -3,3 +3,4 @@ msgid ""
+ msgid "a"
+-msgstr "x"
++msgstr "«x»"
++
+ msgid "b"
+\\ No newline at end of file
+--- a/old.po
++++ /dev/null
+@@ -1 +0,0 @@
+-msgid "a"
+--- /dev/null
++++ b/new.json
+@@ -0,0 +1,2 @@
++{
++}
+"""
+        self.assertEqual(dict(parse_unified_diff(diff.splitlines(True))), {
+            u"fr.po": set([4, 5]),
+            u"new.json": set([1, 2]),
+        })
+
+        # added lines starting with "++ " or "-- " are content, not headers
+        diff = u"""--- a/notes.txt
++++ b/notes.txt
+@@ -1,2 +1,3 @@
+ first
++++ added line starting with two pluses
+--- removed line starting with two minuses
++last
+"""
+        self.assertEqual(dict(parse_unified_diff(diff.splitlines(True))), {u"notes.txt": set([2, 3])})
+
+    def test_changed_lines(self):
+        """ Test that lines of two revisions are compared """
+        from diffs import changed_lines
+
+        self.assertEqual(changed_lines([u"a", u"b", u"c"], [u"a", u"B", u"c", u"d"]), set([2, 4]))
+        self.assertEqual(changed_lines([u"a", u"b"], [u"b"]), set())
+
+    def test_validate_changes(self):
+        """ Test that only the messages touched by a diff are validated """
+        import io
+        import os
+        import shutil
+        import tempfile
+        from diffs import parse_unified_diff, validate_changes
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        po = u"""msgid "'one'"
+msgstr "«un"
+
+msgid "'two'"
+msgstr ""
+"«deux"
+
+msgid "'three'"
+msgstr "«trois»"
+"""
+        with io.open(os.path.join(directory, u"fr.po"), "w", encoding='utf-8') as f:
+            f.write(po)
+        with io.open(os.path.join(directory, u"fr.json"), "w", encoding='utf-8') as f:
+            f.write(u'{\n  "a": "«x",\n  "b": "«y»"\n}\n')
+        with io.open(os.path.join(directory, u"en.json"), "w", encoding='utf-8') as f:
+            f.write(u'{"a": "\'x\'", "b": "\'y\'"}')
+
+        diff = u"""+++ b/fr.po
+@@ -6,2 +6,2 @@
+-"deux"
++"«deux"
+ 
++++ b/fr.json
+@@ -3 +3 @@
++  "b": "«y»"
++++ b/README
+@@ -1 +1 @@
++text
+"""
+        results = list(validate_changes(parse_unified_diff(diff.splitlines(True)), self.language_pair,
+                                        root=directory, json_sources=lambda path: u"en.json"))
+        self.assertEqual([result[:3] for result in results], [
+            (u"fr.po", 5, False),
+            (u"fr.json", u"b", True),
+        ])
+
+
+class TestQuotationNormalizer(unittest.TestCase):
+
+    def test_normalize(self):
+        """ Test that paired neutral quotations are rewritten into the preferred style of a language """
+        from normalize import QuotationNormalizer
+
+        tests = [
+            (constants.LC_FRENCH, u"\"Bonjour\", dit-elle.", u"«Bonjour», dit-elle."),
+            (constants.LC_FRENCH, u"Il a dit 'oui' hier", u"Il a dit «oui» hier"),
+            (constants.LC_FRENCH, u"\"L'homme\" et 'la femme'", u"«L'homme» et «la femme»"),
+            (constants.LC_FRENCH, u"Il a dit \"c'est 'super'\" hier", u"Il a dit \"c'est 'super'\" hier"),
+            (constants.LC_FRENCH, u"«Il a dit \"salut\"»", u"«Il a dit \"salut\"»"),
+            (constants.LC_GERMAN, u"Er sagte \"Hallo\".", u"Er sagte „Hallo“."),
+            (constants.LC_THAI, u"เขาพูดว่า 'สวัสดี'", u"เขาพูดว่า “สวัสดี”"),
+            (constants.LC_FRENCH, u"«oui» et “non”", u"«oui» et “non”"),
+            (constants.LC_FRENCH, u"\"orphelin", u"\"orphelin"),
+            (constants.LC_ENGLISH, u"\"Hello\"", u"\"Hello\""),
+        ]
+
+        for lc, text, expected in tests:
+            normalized, edits = QuotationNormalizer(lc).normalize(text)
+            self.assertEqual(normalized, expected)
+            self.assertEqual(len(edits), sum(1 for a, b in zip(text, expected) if a != b))
+            for index, original, replacement in edits:
+                self.assertEqual((text[index], normalized[index]), (original, replacement))
+
+    def test_normalized_outputs_validate(self):
+        """ Test that texts are only rewritten into texts that validate, and valid texts stay valid """
+        import random
+        from normalize import QuotationNormalizer
+        from utils import QUOTATION_MAP
+
+        rng = random.Random(0)
+        for lc in sorted(QUOTATION_MAP):
+            language_pair = "{}_{}".format(constants.LC_ENGLISH, lc)
+            normalizer = QuotationNormalizer(lc)
+            alphabet = u"ab  '\"" + QUOTATION_MAP[lc][:4]
+            for _ in range(500):
+                text = u"".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+                normalized, edits = normalizer.normalize(text)
+                if edits or QuotationValidator.validate(u"", text, language_pair):
+                    self.assertTrue(QuotationValidator.validate(u"", normalized, language_pair), msg=repr(text))
+
+    def test_normalized_validates(self):
+        """ Test that normalizing fixes translations failing on lone neutral quotations """
+        from normalize import QuotationNormalizer
+
+        translation = u"\"Bonjour\" et au revoir"
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        self.assertFalse(QuotationValidator.validate(u"", translation, language_pair))
+
+        normalized, _ = QuotationNormalizer(constants.LC_FRENCH).normalize(translation)
+        self.assertTrue(QuotationValidator.validate(u"", normalized, language_pair))
+
+
+class TestDifferential(unittest.TestCase):
+
+    def test_engines_agree(self):
+        """ Test that every registered engine and extractor agrees with the frozen reference on random texts """
+        import differential
+
+        for seed in range(3):
+            disagreements = differential.run(cases=200, seed=seed)
+            self.assertEqual(disagreements, [], msg=repr(disagreements[:1]))
+
+    def test_minimise(self):
+        """ Test that reproducers are minimised while they keep failing """
+        from differential import minimise
+
+        self.assertEqual(minimise(u"ab«cd»ef", lambda text: u"«" in text), u"«")
+
+    def test_disagreements_found(self):
+        """ Test that differing error messages and extractions are reported """
+        import differential
+
+        def wrong_message(language_pair, strict):
+            def validate(source, translation):
+                ok, error = QuotationValidator.validate(source, translation, language_pair, verbose=True, strict=strict)
+                return (ok, error) if ok else (ok, type(error)(u"orphans"))
+            return validate
+
+        disagreements = differential.run(cases=20, engines={"wrong_message": wrong_message}, extractors={})
+        self.assertTrue(disagreements)
+        self.assertEqual(disagreements[0]["actual"][2], u"orphans")
+
+        # an engine ignoring lookalikes is caught when registered as normalizing
+        disagreements = differential.run(cases=50, engines={}, extractors={},
+                                         normalizing_engines={"plain": differential._validate})
+        self.assertTrue(disagreements)
+        self.assertTrue(all(disagreement["normalize"] for disagreement in disagreements))
+
+    def test_engines_get_generated_texts(self):
+        """ Test that minimising a disagreement does not change the texts given to the next engines """
+        import differential
+        from errors import QuotationMissingPair
+
+        def recorder(calls):
+            def factory(language_pair, strict):
+                validate = differential._validate(language_pair, strict)
+
+                def record(source, translation):
+                    calls.append((source, translation))
+                    return validate(source, translation)
+                return record
+            return factory
+
+        def always_wrong(language_pair, strict):
+            return lambda source, translation: (False, QuotationMissingPair(u"always"))
+
+        expected, actual = [], []
+        differential.run(cases=10, seed=1, engines={"b": recorder(expected)}, extractors={}, normalizing_engines={})
+        differential.run(cases=10, seed=1, engines={"a": always_wrong, "b": recorder(actual)}, extractors={},
+                         normalizing_engines={})
+        self.assertEqual(actual, expected)
+
+        disagreements = differential.run(cases=20, engines={}, extractors={
+            "first_only": lambda text, lc: (None, differential.reference_scan(text, lc)[1][:1], None, None)})
+        self.assertTrue(disagreements)
+        self.assertEqual(len(disagreements[0]["expected"][0]), 2)
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_run(self):
+        """ Test that the load generator reports throughput and latency percentiles """
+        import json
+        import threading
+        import loadtest
+
+        try:
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+            from socketserver import ThreadingMixIn
+        except ImportError:  # python 2
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+            from SocketServer import ThreadingMixIn
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+            wbufsize = -1  # one write per response; split ones wait for delayed acks on kept alive connections
+            connections = set()
+
+            def do_POST(self):
+                self.connections.add(self.client_address)
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode('utf-8'))
+                ok = QuotationValidator.validate(payload["source"], payload["translation"], payload["language_pair"])
+                body = json.dumps({"ok": ok}).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True  # clients keep their connections open
+
+        server = Server(("localhost", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        url = "http://localhost:{}".format(server.server_address[1])
+        report = loadtest.run(url, requests=40, concurrency=4, mix=loadtest.SegmentMix(invalid_ratio=0, seed=1))
+        self.assertEqual((report["requests"], report["failures"]), (40, 0))
+        self.assertTrue(report["p50"] <= report["p95"] <= report["p99"] <= report["p999"])
+
+        self.assertEqual(len(Handler.connections), 4)  # one kept alive connection per client
+
+        self.assertEqual(loadtest.regressions(report, report), [])
+        slower = dict(report, throughput=report["throughput"] * 0.5, p99=report["p99"] * 2)
+        self.assertEqual(len(loadtest.regressions(slower, report)), 2)
+
+        best, reports = loadtest.find_capacity(url, 60, requests=10, max_concurrency=4)
+        self.assertEqual([step["concurrency"] for step in reports], [1, 2, 4])
+        self.assertTrue(best["within_budget"])
+        best, reports = loadtest.find_capacity(url, 0, requests=10)
+        self.assertEqual((best, [step["concurrency"] for step in reports]), (None, [1]))
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_coalesce(self):
+        """ Test that concurrent requests are validated in batches and get their own results """
+        import threading
+        from server.batching import MicroBatcher
+
+        entered, gate = threading.Event(), threading.Event()
+
+        class HeldBatcher(MicroBatcher):
+            def _run(self, key, requests):
+                # hold the first batch so that the other requests find one in flight
+                entered.set()
+                gate.wait()
+                MicroBatcher._run(self, key, requests)
+
+        batcher = HeldBatcher(window=0.5, max_batch=8)
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        translations = [u"«Bonjour», dit-elle.", u"\"Bonjour, dit-elle."] * 8 + [u"«Salut»"]
+        results = [None] * len(translations)
+
+        def request(index):
+            results[index] = batcher.validate(u"'Hello,' she said.", translations[index], language_pair)
+
+        threads = [threading.Thread(target=request, args=(index,)) for index in range(len(translations))]
+        threads[-1].start()
+        entered.wait()
+        for thread in threads[:-1]:
+            thread.start()
+        gate.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([ok for ok, _ in results], [True, False] * 8 + [True])
+        self.assertEqual(batcher.segments, 17)
+        self.assertEqual(batcher.batches, 3)
+
+    def test_lone_request(self):
+        """ Test that a request with no other in flight does not wait for the window """
+        import time
+        from server.batching import MicroBatcher
+
+        batcher = MicroBatcher(window=5)
+        start = time.time()
+        for _ in range(3):
+            self.assertTrue(batcher.validate(u"", u"«Bonjour»", "en_fr")[0])
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(batcher.batches, 3)
+
+    def test_malformed(self):
+        """ Test that a malformed segment only fails its own request """
+        from server.batching import MicroBatcher, _Request
+
+        requests = [_Request((u"", u"«oui»")), _Request((u"", 5)), _Request((u"", u"«non"))]
+        MicroBatcher()._run(("en_fr", False), requests)
+        self.assertEqual([request.result is not None and request.result[0] for request in requests],
+                         [True, False, False])
+        self.assertTrue(isinstance(requests[1].error, TypeError))
+        self.assertEqual((requests[0].error, requests[2].error), (None, None))
+
+
+class TestSidecar(unittest.TestCase):
+
+    def setUp(self):
+        import os
+        import shutil
+        import tempfile
+        import threading
+        from server.sidecar import SidecarServer
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.server = SidecarServer(os.path.join(directory, "quotations.sock"), ["en_fr"])
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_pipelined(self):
+        """ Test that pipelined requests get their own results in order """
+        from server.sidecar import SidecarClient
+
+        client = SidecarClient(self.server.server_address, window=7)
+        self.addCleanup(client.close)
+        self.assertEqual(client.pair_id("en_fr"), 0)
+
+        segments = [(u"'Hello,' she said.", u"«Bonjour», dit-elle."), (u"", u"\"Bonjour, dit-elle.")] * 20
+        results = list(client.validate_many(segments, "en_fr"))
+        self.assertEqual([ok for ok, _, _ in results], [True, False] * 20)
+        self.assertEqual(results[1][1], "QuotationMissingPair")
+        self.assertEqual(results[1][2], QuotationValidator.validate(u"", u"\"Bonjour, dit-elle.", "en_fr",
+                                                                    verbose=True)[1].args[0])
+
+        self.assertEqual(client.pair_id("ja_en"), 1)
+        self.assertEqual(client.validate(u"「こんにちは、」と彼女", u"'Hello,' she said.", "ja_en", strict=True),
+                         (True, None, u""))
+        self.assertRaises(ValueError, client.pair_id, "en_xx")
+
+    def test_malformed(self):
+        """ Test that malformed requests get an error response without losing the others pipelined with them """
+        import struct
+        from server.sidecar import (OP_VALIDATE, STATUS_ERROR, STATUS_VALID, SidecarClient, encode_request)
+
+        client = SidecarClient(self.server.server_address)
+        self.addCleanup(client.close)
+
+        def frame(body):
+            return struct.pack(">I", len(body)) + body
+
+        short = frame(struct.pack(">BIHB", OP_VALIDATE, 2, 0, 0) + b"\x00")
+        overlong = frame(struct.pack(">BIHB", OP_VALIDATE, 3, 0, 0) + struct.pack(">I", 100) + b"abc")
+        client._socket.sendall(encode_request(1, OP_VALIDATE, 0, 0, u"", u"«oui»") + short + overlong +
+                               encode_request(4, OP_VALIDATE, 0, 0, u"", u"«non»"))
+        self.assertEqual([client._receive()[:2] for _ in range(4)],
+                         [(1, STATUS_VALID), (2, STATUS_ERROR), (3, STATUS_ERROR), (4, STATUS_VALID)])
+
+
+class TestColumnar(unittest.TestCase):
+
+    def test_round_trip(self):
+        """ Test that results written incrementally are read back, column by column or row by row """
+        import shutil
+        import struct
+        import tempfile
+        from columnar import ColumnarReader, ColumnarWriter
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        language_pair = "{}_{}".format(constants.LC_ENGLISH, constants.LC_FRENCH)
+        segments = [(u"'Hello,' she said.", u"«Bonjour», dit-elle."), (u"'Hello,' she said.", u"«Bonjour, dit-elle.")]
+        with ColumnarWriter(directory, flush_every=3) as writer:
+            writer.write_many(QuotationValidator.validate_batch(segments * 5, language_pair, verbose=True),
+                              language_pair=language_pair)
+            writer.write(10, False, offset=1234)
+
+        with ColumnarReader(directory) as reader:
+            status = reader.columns["status"]  # still held when the reader is closed
+            self.assertEqual(len(reader), 11)
+            self.assertEqual(list(status), [1, 0] * 5 + [0])
+            self.assertEqual(reader[1], {
+                "index": 1, "offset": -1, "ok": False, "error": "QuotationMissingPair",
+                "message": u"there are orphaned quotations: [«]", "language_pair": language_pair,
+            })
+            self.assertEqual(reader[10]["offset"], 1234)
+            self.assertEqual((reader[10]["error"], reader[10]["message"]), ("QuotationValidationError", None))
+            self.assertEqual(len(reader.strings), 3)
+
+        with open("{}/index.col".format(directory), "rb") as f:
+            self.assertEqual(f.read(16), struct.pack("<2q", 0, 1))
+
+    def test_unclosed(self):
+        """ Test that the flushed rows of a result set still being written can be read """
+        import os
+        import shutil
+        import tempfile
+        from columnar import ColumnarReader, ColumnarWriter
+        from errors import QuotationMissingPair
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        writer = ColumnarWriter(directory, flush_every=2)
+        self.addCleanup(writer.close)
+        for index in range(3):
+            writer.write(index, (False, QuotationMissingPair(u"orphaned {}".format(index))))
+
+        with ColumnarReader(directory) as reader:
+            self.assertEqual(len(reader), 2)
+            self.assertEqual([row["message"] for row in reader], [u"orphaned 0", u"orphaned 1"])
+
+        os.remove("{}/meta.json".format(directory))
+        with ColumnarReader(directory) as reader:
+            self.assertEqual(len(reader), 2)
+
+
+class TestStatsRecorder(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        """ Test that statistics are bucketed by time and old buckets are recycled """
+        from server.stats import StatsRecorder
+
+        now = [1000.0]
+        stats = StatsRecorder(bucket_seconds=10, buckets=3, clock=lambda: now[0])
+
+        for latency in (0.001, 0.001, 0.001, 0.2):
+            stats.record(latency, cache_misses=1)
+        stats.record(0.001, errors=["QuotationMissingPair"], cache_hits=1)
+
+        buckets = stats.snapshot()
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual((buckets[0]["requests"], buckets[0]["failed"]), (5, 1))
+        self.assertEqual(buckets[0]["errors"], {"QuotationMissingPair": 1})
+        self.assertAlmostEqual(buckets[0]["cache_hit_rate"], 0.2)
+        self.assertTrue(0.001 <= buckets[0]["p50"] < 0.0013)
+        self.assertTrue(buckets[0]["p99"] >= 0.2)
+
+        now[0] += 10
+        stats.record(0.001)
+        self.assertEqual([bucket["requests"] for bucket in stats.snapshot()], [5, 1])
+
+        now[0] += 30
+        stats.record(0.001)
+        self.assertEqual([bucket["requests"] for bucket in stats.snapshot()], [1])
+
+    def test_endpoints(self):
+        """ Test that every endpoint has its own percentiles """
+        from server.stats import StatsRecorder
+
+        stats = StatsRecorder(clock=lambda: 1000.0)
+        stats.record(0.001)
+        stats.record(2.0, segments=5000, endpoint="/validate/stream")
+
+        self.assertEqual(stats.endpoints, ["/validate", "/validate/stream"])
+        self.assertTrue(stats.snapshot()[0]["p99"] < 0.002)
+        self.assertEqual(stats.snapshot("/validate/stream")[0]["segments"], 5000)
+        self.assertEqual(stats.snapshot("/other"), [])
+
+
 if __name__ == "__main__":
     unittest.main()
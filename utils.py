@@ -2,6 +2,8 @@
 from __future__ import absolute_import
 
 import constants
+from compat import unichr
+from errors import LanguageNotSupported
 
 NEUTRAL_QUOTATIONS = u"\'\'\"\"``"
 NEUTRAL_EXCLUDE = {
@@ -12,7 +14,7 @@ NEUTRAL_EXCLUDE = {
 # long rangers typically appear right after an alphabet
 LONE_RANGERS = u'\'\"’'
 
-QUOTATION_MAP = {
+_LANGUAGE_QUOTATIONS = {
     constants.LC_ENGLISH: NEUTRAL_QUOTATIONS,
     constants.LC_SPANISH: u"«»“”",
     constants.LC_SPANISH_LATIN: u"«»“”",
@@ -24,8 +26,115 @@ QUOTATION_MAP = {
     constants.LC_CHINESE_TRADITIONAL: u"「」『』"
 }
 
-for lc in QUOTATION_MAP:
-    if lc not in NEUTRAL_EXCLUDE:
-        # append NEUTRAL_QUOTATIONS to some languges
-        # because neutral quotations seem to be used in other languages besides english
-        QUOTATION_MAP[lc] += NEUTRAL_QUOTATIONS
+# NEUTRAL_QUOTATIONS are appended to languages not in NEUTRAL_EXCLUDE
+# because neutral quotations seem to be used in other languages besides english
+QUOTATION_MAP = dict(
+    (lc, quotations if lc in NEUTRAL_EXCLUDE else quotations + NEUTRAL_QUOTATIONS)
+    for lc, quotations in _LANGUAGE_QUOTATIONS.items()
+)
+
+# lookalikes of quotations, with the canonical quotations they may stand for in order of preference
+# compatibility variants (full-width, half-width, vertical forms) are found through NFKC instead
+CONFUSABLE_QUOTATIONS = {
+    u"′": u"'",  # prime
+    u"″": u"\"",  # double prime
+    u"‛": u"‘'",
+    u"‟": u"“\"",
+    u"‹": u"«‘'",
+    u"›": u"»’'",
+    u"〝": u"“「\"",
+    u"〞": u"”」\"",
+    u"〟": u"”」\"",
+}
+
+# unicode blocks searched for compatibility variants of quotations
+_COMPATIBILITY_BLOCKS = ((0x2000, 0x2070), (0x3000, 0x3040), (0xfe10, 0xfe20), (0xfe30, 0xfe50), (0xff00, 0xfff0))
+
+_QUOTATION_TABLES = {}
+_QUOTATION_CHARACTERS = {}
+_QUOTATION_PATTERNS = {}
+_CONFUSABLE_TABLES = {}
+
+
+def split_language_pair(language_pair):
+    """ Returns (source_lc, translation_lc) of a language pair such as "en_fr" or "en_es_la"
+
+    Raises:
+        LanguageNotSupported if either language is not supported
+    """
+    parts = language_pair.split("_")
+    for index in range(1, len(parts)):
+        source_lc, translation_lc = "_".join(parts[:index]), "_".join(parts[index:])
+        if source_lc in QUOTATION_MAP and translation_lc in QUOTATION_MAP:
+            return source_lc, translation_lc
+
+    raise LanguageNotSupported(u"[{}] language pair is not supported".format(language_pair))
+
+
+def quotation_table(lc):
+    """ Returns a dict of quotation character to its (first) position in QUOTATION_MAP[lc]
+
+    Tables are built the first time a language is used.
+    """
+    try:
+        return _QUOTATION_TABLES[lc]
+    except KeyError:
+        table = {}
+        for position, char in enumerate(QUOTATION_MAP[lc]):
+            table.setdefault(char, position)
+        _QUOTATION_TABLES[lc] = table
+        return table
+
+
+def quotation_characters(lc):
+    """ Returns the distinct quotation characters of QUOTATION_MAP[lc] as a string """
+    try:
+        return _QUOTATION_CHARACTERS[lc]
+    except KeyError:
+        characters = _QUOTATION_CHARACTERS[lc] = u"".join(sorted(set(QUOTATION_MAP[lc])))
+        return characters
+
+
+def quotation_pattern(lc):
+    """ Returns a compiled regular expression matching any quotation character of QUOTATION_MAP[lc]
+
+    re is only imported once a language is first scanned, keeping it off the import path.
+    """
+    try:
+        return _QUOTATION_PATTERNS[lc]
+    except KeyError:
+        import re
+
+        pattern = re.compile(u"[{}]".format(u"".join(re.escape(char) for char in quotation_characters(lc))))
+        _QUOTATION_PATTERNS[lc] = pattern
+        return pattern
+
+
+def confusable_table(lc):
+    """ Returns a translation table (for unicode.translate) of lookalikes to quotations of QUOTATION_MAP[lc]
+
+    Lookalikes are only mapped to single characters so that offsets of translated texts are kept.
+    Tables are built the first time a language is used.
+    """
+    try:
+        return _CONFUSABLE_TABLES[lc]
+    except KeyError:
+        import unicodedata
+
+        quotations = QUOTATION_MAP[lc]
+        table = {}
+        for start, end in _COMPATIBILITY_BLOCKS:
+            for codepoint in range(start, end):
+                char = unichr(codepoint)
+                canonical = unicodedata.normalize('NFKC', char)
+                if canonical != char and len(canonical) == 1 and canonical in quotations:
+                    table[codepoint] = ord(canonical)
+
+        for char, candidates in CONFUSABLE_QUOTATIONS.items():
+            for canonical in candidates:
+                if canonical in quotations:
+                    table[ord(char)] = ord(canonical)
+                    break
+
+        _CONFUSABLE_TABLES[lc] = table
+        return table